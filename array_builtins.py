@@ -0,0 +1,176 @@
+'''
+Builtins working on whole arrays(see `ast.Array`).
+They go over the buffer of an array with slices of `array.array`, `map`, `sorted` and
+`itertools.accumulate`, which run in C, instead of one interpreted statement per element.
+The elements of a multi-dimensional array are taken row by row, those of the rows put in place of
+other rows included(see `ast.Array.split`), and the arrays returned have the shape of the elements
+of the first array given
+'''
+import array
+import builtins
+import itertools
+import operator
+
+# The tree walker module, imported while it is being initialized: its names are only read at call time
+import ast
+
+
+def is_array(value):
+    return type(value) is ast.Array
+
+
+def expect_array(name, value):
+    if not is_array(value):
+        raise Exception('{} expects an array, got {}'.format(name, type(value)))
+
+
+def pack(values, shape):
+    'New array of `shape` holding the list `values`, typed when they are all ints or all floats'
+    kinds = set(map(type, values))
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind in ast.ArrayBuffer.typecodes:
+            try:
+                buffer = ast.ArrayBuffer(array.array(ast.ArrayBuffer.typecodes[kind], values), kind)
+                return ast.Array.view(buffer, 0, shape)
+            except OverflowError:
+                pass
+    return ast.Array.view(ast.ArrayBuffer(values), 0, shape)
+
+
+def write(arr, start, values):
+    'Store the list `values` in the elements of `arr` from the element `start`'
+    rows = arr.split_rows()
+    if rows is not None:
+        # The elements are held by the rows
+        end = start + len(values)
+        position = 0
+        for i, row in enumerate(rows):
+            count = row.element_count() if is_array(row) else 1
+            if position < end and start < position + count:
+                first = max(start, position)
+                part = values[first - start:min(end, position + count) - start]
+                if is_array(row):
+                    write(row, first - position, part)
+                else:
+                    arr[i] = part[0]
+            position += count
+        return
+    buffer = arr.buffer
+    if buffer.type is not None:
+        if set(map(type, values)) - {buffer.type}:
+            buffer.widen()
+        else:
+            try:
+                values = array.array(buffer.items.typecode, values)
+            except OverflowError:
+                buffer.widen()
+    position = arr.offset + start
+    buffer.items[position:position + len(values)] = values
+
+
+def check_range(arr, start, count):
+    if not (0 <= start and 0 <= count and start + count <= arr.element_count()):
+        raise IndexError('array index out of range')
+
+
+def fill(arr, value):
+    'Set every element of `arr` to `value`'
+    expect_array('fill', arr)
+    write(arr, 0, [value] * arr.element_count())
+
+
+def copy_range(dst, dst_start, src, src_start, count):
+    'Copy `count` elements of `src` from `src_start` into `dst` from `dst_start`, the ranges may overlap'
+    expect_array('copy_range', dst)
+    expect_array('copy_range', src)
+    check_range(dst, dst_start, count)
+    check_range(src, src_start, count)
+    if src.split_rows() is not None or dst.split_rows() is not None:
+        write(dst, dst_start, src.elements()[src_start:src_start + count])
+        return
+    position = src.offset + src_start
+    values = src.buffer.items[position:position + count]
+    if src.buffer.type is not None and src.buffer.type is dst.buffer.type:
+        dst.buffer.items[dst.offset + dst_start:dst.offset + dst_start + count] = values
+    else:
+        write(dst, dst_start, list(values))
+
+
+def sum(*args):
+    'Sum of the elements of an array, or of the arguments'
+    if len(args) == 1 and is_array(args[0]):
+        return builtins.sum(args[0].elements())
+    return builtins.sum(args)
+
+
+def min(*args):
+    'Smallest element of an array, or smallest argument'
+    if len(args) == 1 and is_array(args[0]):
+        return builtins.min(args[0].elements())
+    return builtins.min(args)
+
+
+def max(*args):
+    'Largest element of an array, or largest argument'
+    if len(args) == 1 and is_array(args[0]):
+        return builtins.max(args[0].elements())
+    return builtins.max(args)
+
+
+def sort(arr):
+    'Sort the elements of `arr` in ascending order, in place'
+    expect_array('sort', arr)
+    write(arr, 0, sorted(arr.elements()))
+
+
+def prefix_sum(arr):
+    'New array whose i-th element is the sum of the elements 0 to i of `arr`'
+    expect_array('prefix_sum', arr)
+    return pack(list(itertools.accumulate(arr.elements())), arr.element_shape())
+
+
+def elementwise(name, func, arr, other):
+    '''
+    New array of func(arr[i], other[i]), `other` is an array with as many elements as `arr`
+    or a value combined with every element
+    '''
+    expect_array(name, arr)
+    left = arr.elements()
+    if is_array(other):
+        if other.element_count() != len(left):
+            raise Exception('{} expects arrays of the same size, got {} and {} elements'.format(
+                name, len(left), other.element_count()))
+        right = other.elements()
+        kinds = {arr.buffer.type, other.buffer.type}
+    else:
+        right = [other] * len(left)
+        kinds = {arr.buffer.type, type(other)}
+    if not kinds <= {int, float}:
+        # Same operand type check as `BinopAexp`
+        for lv, rv in zip(left, right):
+            ast.check_operands(lv, rv)
+    return pack(list(map(func, left, right)), arr.element_shape())
+
+
+def add_arrays(arr, other):
+    'Elementwise arr + other'
+    return elementwise('add_arrays', operator.add, arr, other)
+
+
+def mul_arrays(arr, other):
+    'Elementwise arr * other'
+    return elementwise('mul_arrays', operator.mul, arr, other)
+
+
+functions = {
+    'fill': fill,
+    'copy_range': copy_range,
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'sort': sort,
+    'prefix_sum': prefix_sum,
+    'add_arrays': add_arrays,
+    'mul_arrays': mul_arrays,
+}
@@ -1,24 +1,139 @@
 from built_in_functions import call_built_in, func_list
+from memo import MISSING
+import array
+import operator
+
+'Bindings given by `resolver.py` to the names used in function bodies'
+LOCAL = 0
+MAYBE_LOCAL = 1
+GLOBAL = 2
+DYNAMIC = 3
+
+'Content of the slots of local variables that are not assigned yet'
+UNBOUND = object()
+
+'Positions given by `resolver.py` to the calls whose value is the value of the function body'
+TAIL = 1
+# Last statement of a `Block`, the value of the call is combined with the values of the previous statements
+TAIL_COMBINED = 2
+
+'Functions of the operators, given to the nodes when they are built'
+binop_functions = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '|': operator.or_,
+    '&': operator.and_,
+    '^': operator.xor,
+    'div': operator.floordiv,
+    'shl': operator.lshift,
+    'shr': operator.rshift,
+    '%': operator.mod,
+}
+
+relop_functions = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def check_operands(lv, rv):
+    'Type check performed by `BinopAexp` before operating'
+    try:
+        type(lv)(rv)
+    except Exception:
+        raise Exception('Cannot operate {} with {}'.format(type(lv), type(rv)))
+
+
+class Context:
+    '''
+    Context of a function call. The local variables are stored in `values`,
+    at the slots the resolver gave to them(`names` maps a name to its slot), and
+    `parent` is the context the function was called from. A `parent` of None
+    stands for the global environment
+    '''
+    __slots__ = ['values', 'names', 'parent']
+
+    def __init__(self, values, names, parent):
+        self.values = values
+        self.names = names
+        self.parent = parent
+
+    def __repr__(self):
+        return 'Context @ {}'.format(hex(id(self)))
 
 
 def find_variable(env, call_frame, name):
-    'When `call_frame` is not None, which means the context of current env is in'
-    'a function or several layers of function call. This method is designed for'
-    'finding variables in parent context, whose key is stored in the index -1'
-    t_tree = env.copy()
-    if call_frame is not None and 'global_ref' in env[call_frame] and name in env[call_frame]['global_ref']:
-        return env[name]
-    if call_frame:
-        while name not in t_tree[call_frame] and -1 in t_tree[call_frame]:
-            if t_tree[call_frame][-1] == -1:
-                return t_tree.get(name, None)
-            call_frame = t_tree[call_frame][-1]
-        return t_tree[call_frame].get(name, None)
-    else:
-        return t_tree.get(name, None)
-
-
-class Equality:
+    'Find `name` in the context `call_frame` or in the contexts of its callers.'
+    'Names that are not found in any context are read from the global environment'
+    while call_frame is not None:
+        slot = call_frame.names.get(name)
+        if slot is not None:
+            value = call_frame.values[slot]
+            if value is not UNBOUND:
+                return value
+        call_frame = call_frame.parent
+    return env.get(name, None)
+
+
+class TailCall:
+    '''
+    Call in tail position(see `FuncCallStmt.tail`) returned by the body of a function
+    instead of being run, so that `Func.eval` runs it without nesting Python calls.
+    `normalize` is set once the value of the call goes through a `Block`,
+    which turns a false value into None
+    '''
+    __slots__ = ['func', 'args', 'parent', 'env', 'normalize']
+
+    def __init__(self, func, args, parent, env):
+        self.func = func
+        self.args = args
+        self.parent = parent
+        self.env = env
+        self.normalize = False
+
+    def __repr__(self):
+        return 'TailCall of {}'.format(self.func)
+
+    def run(self):
+        return self.func.eval(self.env, self.args, call_frame=self.parent)
+
+
+def read_variable(env, call_frame, name, kind, slot):
+    'Read a name used in the body of a function through the binding given by the resolver'
+    if kind == LOCAL:
+        return call_frame.values[slot]
+    if kind == GLOBAL:
+        return env.get(name, None)
+    if kind == MAYBE_LOCAL:
+        value = call_frame.values[slot]
+        if value is not UNBOUND:
+            return value
+    return find_variable(env, call_frame.parent, name)
+
+
+class Node:
+    '''
+    Base class of the nodes of the tree. `line`(counted from 1) and `column`(from 0) locate
+    the first token of the node in the source, they are None for the nodes not built by the parser
+    '''
+    line = None
+    column = None
+
+
+def locate(node, origin):
+    'Give `node` the position of `origin` and return `node`'
+    node.line = origin.line
+    node.column = origin.column
+    return node
+
+
+class Equality(Node):
     def __eq__(self, other):
         return isinstance(other, self.__class__) and \
                self.__dict__ == other.__dict__
@@ -101,10 +216,12 @@ class VarAexp(Aexp):
     '''
     VarAexp stores a variable
     '''
-    __slots__ = ['name']
+    __slots__ = ['name', 'kind', 'slot']
 
     def __init__(self, name):
         self.name = name
+        self.kind = None
+        self.slot = None
 
     def __repr__(self):
         return 'VarAexp({})'.format(self.name)
@@ -116,13 +233,13 @@ class VarAexp(Aexp):
             else:
                 raise Exception('Variable {} not declared'.format(self.name))
         else:
-            ret = find_variable(env, call_frame, self.name)
+            ret = read_variable(env, call_frame, self.name, self.kind, self.slot)
             if ret is None:
                 raise Exception('Variable {} not declared'.format(self.name))
             return ret
 
 
-class SubscriptExp:
+class SubscriptExp(Node):
     '''
     SubscriptExp process indexing an object
     '''
@@ -130,6 +247,8 @@ class SubscriptExp:
     def __init__(self, obj, idx):
         self.obj = obj
         self.idx = idx
+        self.kind = None
+        self.slot = None
 
     def __repr__(self):
         return '{}{}'.format(self.obj, self.idx)
@@ -141,7 +260,7 @@ class SubscriptExp:
     def eval(self, env, call_frame=None):
         if call_frame:
             # Find the iterable object according to context
-            tar = find_variable(env, call_frame, self.obj)
+            tar = read_variable(env, call_frame, self.obj, self.kind, self.slot)
         else:
             # Find the object from static environment
             tar = env[self.obj]
@@ -150,22 +269,26 @@ class SubscriptExp:
             value = tar.eval(env, call_frame=call_frame)
         else:
             value = tar
-        for i in self.idx:
-            index = i.eval(env, call_frame=call_frame)
-            value = value[index]
-        return value
+        if len(self.idx) == 1:
+            return value[self.idx[0].eval(env, call_frame=call_frame)]
+        return subscript(value, tuple([i.eval(env, call_frame=call_frame) for i in self.idx]))
 
 
 class BinopAexp(Aexp):
     '''
-     Process Arithmetic operations
+     Process Arithmetic operations.
+     The function of the operator is looked up once, when the node is built.
+     Operands that are both ints or both floats skip the type check
     '''
-    __slots__ = ['op', 'left', 'right']
+    __slots__ = ['op', 'left', 'right', 'func']
 
     def __init__(self, op, left, right):
+        if op not in binop_functions:
+            raise RuntimeError('Unknown operator: {}'.format(op))
         self.op = op
         self.left = left
         self.right = right
+        self.func = binop_functions[op]
 
     def __repr__(self):
         return 'BinopAexp({},{},{})'.format(self.left, self.op, self.right)
@@ -173,61 +296,37 @@ class BinopAexp(Aexp):
     def eval(self, env, call_frame=None):
         lv = self.left.eval(env, call_frame=call_frame)
         rv = self.right.eval(env, call_frame=call_frame)
-        try:
-            type(lv)(rv)
-        except Exception:
-            raise Exception('Cannot operate {} with {}'.format(type(lv), type(rv)))
-        ret_dict = {
-            '+': lambda: lv + rv,
-            '-': lambda: lv - rv,
-            '*': lambda: lv * rv,
-            '/': lambda: lv / rv,
-            '|': lambda: lv | rv,
-            '&': lambda: lv & rv,
-            '^': lambda: lv ^ rv,
-            'div': lambda: lv // rv,
-            'shl': lambda: lv << rv,
-            'shr': lambda: lv >> rv,
-            '%': lambda: lv % rv,
-        }
-        if self.op in ret_dict:
-            return ret_dict[self.op]()
-        else:
-            raise RuntimeError('Unknown operator: {}'.format(self.op))
+        t = type(lv)
+        if t is not type(rv) or (t is not int and t is not float):
+            check_operands(lv, rv)
+        return self.func(lv, rv)
 
 
 class RelopBexp(Aexp):
     '''
     Process relation operator(returns bool)
     '''
-    __slots__ = ['op', 'left', 'right']
+    __slots__ = ['op', 'left', 'right', 'func']
 
     def __init__(self, op, left, right):
+        if op not in relop_functions:
+            raise RuntimeError('Unknown operator: {}'.format(op))
         self.op = op
         self.left = left
         self.right = right
+        self.func = relop_functions[op]
 
     def __repr__(self):
         return 'RelopAexp({},{},{})'.format(self.left, self.op, self.right)
 
     def eval(self, env, call_frame=None):
-        lv = self.left.eval(env, call_frame=call_frame)
-        rv = self.right.eval(env, call_frame=call_frame)
-        ret_dict = {
-            '>': lambda: lv > rv,
-            '<': lambda: lv < rv,
-            '>=': lambda: lv >= rv,
-            '<=': lambda: lv <= rv,
-            '=': lambda: lv == rv,
-            '!=': lambda: lv != rv,
-        }
-        if self.op in ret_dict:
-            return ret_dict[self.op]()
-        else:
-            raise RuntimeError('Unknown operator: {}'.format(self.op))
+        return self.func(self.left.eval(env, call_frame=call_frame), self.right.eval(env, call_frame=call_frame))
 
 
 class AndBexp(Bexp):
+    '''
+    andalso: the right operand is only evaluated when the left one is true
+    '''
     __slots__ = ['left', 'right']
 
     def __init__(self, left, right):
@@ -238,12 +337,13 @@ class AndBexp(Bexp):
         return 'AndBexp({},{},{})'.format(self.left, '&&', self.right)
 
     def eval(self, env, call_frame=None):
-        lv = self.left.eval(env, call_frame=call_frame)
-        rv = self.right.eval(env, call_frame=call_frame)
-        return lv and rv
+        return self.left.eval(env, call_frame=call_frame) and self.right.eval(env, call_frame=call_frame)
 
 
 class OrBexp(Bexp):
+    '''
+    orelse: the right operand is only evaluated when the left one is false
+    '''
     __slots__ = ['left', 'right']
 
     def __init__(self, left, right):
@@ -254,9 +354,7 @@ class OrBexp(Bexp):
         return 'OrBexp({},{},{})'.format(self.left, '|', self.right)
 
     def eval(self, env, call_frame=None):
-        lv = self.left.eval(env, call_frame=call_frame)
-        rv = self.right.eval(env, call_frame=call_frame)
-        return lv or rv
+        return self.left.eval(env, call_frame=call_frame) or self.right.eval(env, call_frame=call_frame)
 
 
 class XorBexp(Bexp):
@@ -294,6 +392,8 @@ class AssigenmentStmt(Statement):
         self.name = name
         self.aexp = aexp
         self.global_assign = global_assign
+        self.kind = None
+        self.slot = None
 
     def __repr__(self):
         return 'AssignStatement({}, {})'.format(self.name, self.aexp)
@@ -302,25 +402,17 @@ class AssigenmentStmt(Statement):
         value = self.aexp.eval(env, call_frame=call_frame)
         if isinstance(self.name, SubscriptExp):
             obj, idx = self.name.get_target()
-            idx = list(map(lambda i: i.eval(env, call_frame=call_frame), idx))
+            idx = tuple([i.eval(env, call_frame=call_frame) for i in idx])
             if call_frame:
-                obj = find_variable(env, call_frame, obj)
+                obj = read_variable(env, call_frame, obj, self.name.kind, self.name.slot)
             else:
                 obj = env[obj]
-
-            def modify(xs, i):
-                'This method fetches the target object. It is used to deal with multi-indexing(a[0][1][2] = 3)'
-                if len(i) == 1:
-                    xs[i[0]] = value
-                else:
-                    return modify(xs[i[0]], i[1:])
-
-            modify(obj, idx)
+            store_subscript(obj, idx, value)
         elif call_frame:
-            if 'global_ref' in env[call_frame] and self.name in env[call_frame]['global_ref']:
+            if self.kind == GLOBAL:
                 env[self.name] = value
             else:
-                env[call_frame][self.name] = value
+                call_frame.values[self.slot] = value
         else:
             env[self.name] = value
 
@@ -333,29 +425,36 @@ class GlobalStmt(Statement):
         return 'Global Copying for {}'.format(self.name)
 
     def eval(self, env, call_frame=None):
+        # The resolver binds the name to the global environment in the whole function body
         if self.name not in env:
             raise Exception('{} is not declared in global scope'.format(self.name))
-        if call_frame is not None:
-            if 'global_ref' not in env[call_frame]:
-                env[call_frame]['global_ref'] = []
-            env[call_frame]['global_ref'].append(self.name)
 
 
-class CompoundStmt(Statement):
-    def __init__(self, left, right):
-        self.right = right
-        self.left = left
+class Block(Statement):
+    '''
+    List of statements(at least two) separated by newlines.
+    Every statement is evaluated, the value of the block is the first true value of its statements or None
+    '''
+
+    def __init__(self, stmts):
+        self.stmts = stmts
 
     def __repr__(self):
-        return 'CompoundStatement({},{})'.format(self.left, self.right)
+        return 'Block[{}]'.format(', '.join(map(repr, self.stmts)))
 
     def eval(self, env, call_frame=None):
-        lv = self.left.eval(env, call_frame=call_frame)
-        rv = self.right.eval(env, call_frame=call_frame)
-        if lv:
-            return lv
-        elif rv:
-            return rv
+        value = None
+        for stmt in self.stmts:
+            result = stmt.eval(env, call_frame=call_frame)
+            if value is None and result:
+                value = result
+        if type(result) is TailCall:
+            if value is not result:
+                # The value of the block is already known, the call only runs for its effects
+                result.run()
+                return value
+            result.normalize = True
+        return value
 
 
 class IfStmt(Statement):
@@ -434,135 +533,437 @@ class NegateStmt(Statement):
 
 
 class Func:
-    def __init__(self, name, param, body, caller=None):
+    '''
+    Function value. Calls do not copy it: every call gets its own `Context`,
+    which is dropped as soon as the call returns unless a closure created by the call keeps it.
+    `caller` is the context the function was declared in or last called from,
+    `memo` caches the results of the calls once the function is memoized(see `memo.py`)
+    '''
+    __slots__ = ['name', 'param', 'body', 'caller', 'scope', 'memo']
+
+    def __init__(self, name, param, body, caller=None, scope=None):
         self.name = name
         self.param = param
         self.body = body
-        self.func_id = id(self)
-        self.caller_id = caller
+        self.caller = caller
+        self.scope = scope
+        self.memo = None
 
     def __repr__(self):
         return 'Function: {}({})'.format(self.name, self.param)
 
     def eval(self, env, param_list=(), call_frame=None):
-        # Set up context
-        env[self.func_id] = {}
-        env[self.func_id][self.name] = self  # put itself into the context to prepare for recursive call
-        if not call_frame:
-            # Put the static environment into its parent context
-            # env[self.func_id].update({-1: dict(filter(lambda x: x[0] != self.func_id, env.items()))})
-            env[self.func_id].update({-1: -1})
-        if self.caller_id and self.caller_id in env:
-            # If it is called by its parent method, update the parent context
-            # env[self.func_id].update({-1: env[self.caller_id]})
-            env[self.func_id].update({-1: self.caller_id})
-        if param_list:
-            # Process parameters
-            param_list = tuple(map(lambda x: x.eval(env, call_frame=call_frame) if isinstance(x, Statement)
-                                                                                   or isinstance(x, Aexp)
-                                                                                   or isinstance(x, Bexp)
-                                                                                   or isinstance(x, SubscriptExp)
-            else x,
-                                   param_list))
-        if self.name in func_list:
-            return call_built_in(self.name, param_list)
-        for i, j in zip(self.param, param_list):
-            env[self.func_id][i] = j
-        ans = self.body.eval(env, call_frame=self.func_id)
-        # env[self.func_id].clear()
-        # print(env.get(self.func_id))
-        return ans
+        '''
+        Run the body with the evaluated arguments `param_list`, `call_frame` becomes the parent context.
+        The calls in tail position returned by the body are run by the same loop
+        '''
+        func = self
+        normalize = False
+        while True:
+            if func.memo is not None:
+                result = func.memo_eval(env, param_list, call_frame)
+                return None if normalize and not result else result
+            result = func.body.eval(env, call_frame=func.context(param_list, call_frame))
+            if type(result) is not TailCall:
+                if normalize and not result:
+                    return None
+                return result
+            normalize = normalize or result.normalize
+            func, param_list, call_frame = result.func, result.args, result.parent
+
+    def context(self, param_list, call_frame):
+        'Context of a call with the arguments `param_list`'
+        scope = self.scope
+        # Parameters take the first slots of the context
+        values = list(param_list)
+        values.extend([UNBOUND] * (scope.size - len(values)))
+        if scope.self_slot is not None:
+            # put itself into the context to prepare for recursive call
+            values[scope.self_slot] = self
+        return Context(values, scope.slots, call_frame)
+
+    def memo_eval(self, env, param_list, call_frame):
+        'Value of a call of a memoized function, the body only runs when the arguments are not cached'
+        memo = self.memo
+        key = memo.key(param_list)
+        value = memo.get(key)
+        if value is MISSING:
+            value = self.body.eval(env, call_frame=self.context(param_list, call_frame))
+            if type(value) is TailCall:
+                normalize = value.normalize
+                value = value.run()
+                if normalize and not value:
+                    value = None
+            value = memo.put(key, value)
+        return value
 
 
 class Lambda(Func):
+    __slots__ = []
+
     def __repr__(self):
-        if self.caller_id:
-            return 'LambdaFunction from local {} @ {}'.format(hex(self.caller_id), hex(id(self)))
+        if self.caller:
+            return 'LambdaFunction from local {} @ {}'.format(hex(id(self.caller)), hex(id(self)))
         return 'LambdaFunction @ {}'.format(hex(id(self)))
 
 
+class ArrayBuffer:
+    '''
+    Elements of an `Array` and of its views. While every element has the type `type`(int or float),
+    `items` is an `array.array` holding them unboxed, otherwise it is a list.
+    `shape` is the shape of the array the buffer was made for. Once that array is split(see `Array.split`),
+    `rows` maps the position and number of dimensions of each of its multi-dimensional rows to the
+    array holding the row from then on. `holds_rows` tells the lists made by the split, whose items are
+    the rows of a multi-dimensional array rather than its elements
+    '''
+    __slots__ = ['items', 'type', 'exports', 'shape', 'rows', 'holds_rows']
+
+    typecodes = {int: 'q', float: 'd'}
+
+    def __init__(self, items, kind=None):
+        self.items = items
+        self.type = kind
+        self.exports = []
+        self.shape = None
+        self.rows = None
+        self.holds_rows = False
+
+    @staticmethod
+    def filled(value, count):
+        'Buffer of `count` times `value`'
+        kind = type(value)
+        if kind in ArrayBuffer.typecodes:
+            try:
+                return ArrayBuffer(array.array(ArrayBuffer.typecodes[kind], [value]) * count, kind)
+            except OverflowError:
+                pass
+        return ArrayBuffer([value] * count)
+
+    def cells(self, shape):
+        '''
+        Memoryview of the typed items with the given shape, indexed by tuples of indexes.
+        It is released, and fails when used, once the buffer is widened
+        '''
+        cells = memoryview(self.items).cast('B').cast(self.items.typecode, shape)
+        self.exports.append(cells)
+        return cells
+
+    def release(self):
+        'Release the memoryviews returned by `cells`'
+        for cells in self.exports:
+            cells.release()
+        self.exports = []
+
+    def widen(self):
+        'Switch to a list, which holds any value'
+        if self.type is not None:
+            self.release()
+            self.items = self.items.tolist()
+            self.type = None
+
+    def store(self, position, value):
+        if type(value) is not self.type:
+            self.widen()
+        try:
+            self.items[position] = value
+        except OverflowError:
+            # Ints beyond 64 bits
+            self.widen()
+            self.items[position] = value
+
+
 class Array(Subscriptable):
-    def __init__(self, size, init_value):
-        self.size = size
-        self.init_value = init_value
-        self.data = []
+    '''
+    Array of `size` elements, all starting as `init_value`(0 when None). Ints and floats
+    are stored in a typed buffer until another value is stored(see `ArrayBuffer`).
+    When `init_value` is an array, the array is multi-dimensional: its elements are laid out
+    row by row in a single buffer, `a[i][j]` is located at once(see `get`) and `a[i]` alone
+    is a view of the row sharing the buffer
+    '''
+    __slots__ = ['buffer', 'offset', 'shape', 'strides', 'size', 'flat', 'cells']
+
+    def __init__(self, size, init_value=None):
         if init_value is None:
             init_value = 0
         if isinstance(init_value, Array):
-            for i in range(0, size):
-                # To prevent referencing objects in an array
-                self.data.append(init_value.copy())
+            # Every row gets its own copy of the elements
+            buffer = ArrayBuffer(init_value.elements() * size, init_value.buffer.type)
+            self.attach(buffer, 0, (size,) + init_value.element_shape())
         else:
-            self.data = [init_value] * size
+            self.attach(ArrayBuffer.filled(init_value, size), 0, (size,))
+
+    @staticmethod
+    def view(buffer, offset, shape, strides=None):
+        ret = Array.__new__(Array)
+        ret.attach(buffer, offset, shape, strides)
+        return ret
+
+    def attach(self, buffer, offset, shape, strides=None):
+        if strides is None:
+            strides = row_strides(shape)
+        self.buffer = buffer
+        self.offset = offset
+        self.shape = shape
+        self.strides = strides
+        self.size = shape[0]
+        whole = offset == 0 and len(buffer.items) == self.count()
+        if whole and buffer.shape is None:
+            buffer.shape = shape
+        # One-dimensional array covering its whole buffer, indexed directly
+        self.flat = whole and len(shape) == 1
+        self.cells = None
+        if whole and len(shape) > 1 and buffer.type is not None and min(shape) > 0:
+            self.cells = buffer.cells(shape)
 
     def __repr__(self):
-        return 'Array of {}'.format(self.data)
+        return 'Array of {}'.format([self[i] for i in range(self.size)])
+
+    def __eq__(self, other):
+        # Views of the same row are the same array
+        return self is other or (type(other) is Array and self.buffer is other.buffer and
+                                 self.offset == other.offset and self.shape == other.shape)
+
+    def __hash__(self):
+        return hash((id(self.buffer), self.offset, self.shape))
 
     def __getitem__(self, item):
-        return self.data[item]
+        if self.flat:
+            return self.buffer.items[item]
+        return self.get((item,))
 
     def __setitem__(self, key, value):
-        self.data[key] = value
+        if self.flat:
+            self.buffer.store(key, value)
+        else:
+            self.put((key,), value)
+
+    def count(self):
+        'Number of elements of the array, over all of its dimensions'
+        count = 1
+        for n in self.shape:
+            count *= max(n, 0)
+        return count
+
+    def split_rows(self):
+        'Rows of an array split by `split`, None when its elements are laid out in its buffer'
+        if self.buffer.rows is not None and len(self.shape) > 1:
+            self.move()
+        if self.buffer.holds_rows:
+            return self.buffer.items[self.offset:self.offset + self.size]
+        return None
+
+    def elements(self):
+        'Copy of the elements, row by row, the rows of a split array included'
+        rows = self.split_rows()
+        if rows is not None:
+            return [e for row in rows for e in (row.elements() if type(row) is Array else [row])]
+        return self.buffer.items[self.offset:self.offset + self.count()]
+
+    def element_count(self):
+        'Number of elements returned by `elements`'
+        rows = self.split_rows()
+        if rows is None:
+            return self.count()
+        return sum(row.element_count() if type(row) is Array else 1 for row in rows)
+
+    def element_shape(self):
+        '''
+        Shape of the elements returned by `elements`: the shape of the array, unless rows of
+        other shapes were put in place of some of its rows
+        '''
+        rows = self.split_rows()
+        if rows is None:
+            return self.shape
+        shapes = {row.element_shape() if type(row) is Array else () for row in rows}
+        if len(shapes) == 1:
+            return (self.size,) + shapes.pop()
+        return (self.element_count(),)
 
     def copy(self):
-        ret = Array(self.size, self.init_value)
-        ret.data = self.data.copy()
-        return ret
+        return Array.view(ArrayBuffer(self.elements(), self.buffer.type), 0, self.element_shape())
+
+    def locate(self, indexes):
+        'Position in the buffer of the row or element at `indexes`, one index per dimension at most'
+        position = self.offset
+        for i, n, stride in zip(indexes, self.shape, self.strides):
+            if type(i) is not int:
+                i = operator.index(i)
+            if i < 0:
+                i += n
+            if not 0 <= i < n:
+                raise IndexError('array index out of range')
+            position += i * stride
+        return position
+
+    def get(self, indexes):
+        'self[i0][i1]...[in] for the tuple `indexes`, without building the views of the rows in between'
+        cells = self.cells
+        if cells is not None:
+            try:
+                return cells[indexes]
+            except (TypeError, ValueError, NotImplementedError):
+                # Not one int index per dimension, or the buffer was widened and the cells released
+                if self.buffer.type is None:
+                    self.cells = None
+        ndim = len(self.shape)
+        if self.buffer.rows is not None and ndim > 1:
+            self.move()
+            return self.get(indexes)
+        position = self.locate(indexes)
+        if len(indexes) < ndim:
+            return Array.view(self.buffer, position, self.shape[len(indexes):], self.strides[len(indexes):])
+        value = self.buffer.items[position]
+        if len(indexes) > ndim:
+            return subscript(value, indexes[ndim:])
+        return value
 
-    def eval(self, env, call_frame=None):
-        return self.data
+    def put(self, indexes, value):
+        'self[i0][i1]...[in] := value for the tuple `indexes`'
+        cells = self.cells
+        if cells is not None and type(value) is self.buffer.type:
+            try:
+                cells[indexes] = value
+                return
+            except (TypeError, ValueError, NotImplementedError):
+                if self.buffer.type is None:
+                    self.cells = None
+        ndim = len(self.shape)
+        if self.buffer.rows is not None and ndim > 1:
+            self.move()
+            self.put(indexes, value)
+            return
+        if len(indexes) < ndim:
+            # Replacing a row: the rows can no longer be parts of a single buffer
+            self.split()
+            store_subscript(self, indexes, value)
+            return
+        position = self.locate(indexes)
+        if len(indexes) > ndim:
+            store_subscript(self.buffer.items[position], indexes[ndim:], value)
+        else:
+            self.buffer.store(position, value)
+
+    def split(self):
+        '''
+        Hold the rows of a multi-dimensional array in lists, so that they can be replaced.
+        The whole array the buffer was made for is split, then each of its views is moved to the
+        list holding its row when it is next used(see `move`). The one-dimensional rows remain views of the buffer
+        '''
+        buffer = self.buffer
+        if buffer.rows is None:
+            shape = buffer.shape
+            strides = row_strides(shape)
+            rows = {}
+
+            def split_row(offset, level):
+                if level == len(shape) - 1:
+                    return Array.view(buffer, offset, shape[level:], strides[level:])
+                items = [split_row(offset + i * strides[level], level + 1) for i in range(shape[level])]
+                row_buffer = ArrayBuffer(items)
+                row_buffer.holds_rows = True
+                row = Array.view(row_buffer, 0, (len(items),))
+                rows[offset, len(shape) - level] = row
+                return row
+
+            split_row(0, 0)
+            # The rows replaced from now on are no longer read through the buffer
+            buffer.release()
+            buffer.rows = rows
+        self.move()
+
+    def move(self):
+        'Attach the view of a multi-dimensional row of a split buffer to the array now holding the row'
+        row = self.buffer.rows[self.offset, len(self.shape)]
+        self.attach(row.buffer, 0, row.shape)
+
+
+def row_strides(shape):
+    'Distance in the buffer between two consecutive indexes of each dimension of an array laid out row by row'
+    strides = (1,)
+    for n in reversed(shape[1:]):
+        strides = (strides[0] * n,) + strides
+    return strides
+
+
+def subscript(obj, idx):
+    'obj[i0][i1]...[in] for the tuple `idx`, the indexes of all the dimensions of an `Array` are resolved at once'
+    if type(obj) is Array:
+        return obj.get(idx)
+    for i in idx:
+        obj = obj[i]
+    return obj
+
+
+def store_subscript(obj, idx, value):
+    'Assign `value` to obj[i0][i1]...[in] for the tuple `idx`'
+    if type(obj) is Array and len(idx) > 1:
+        obj.put(idx, value)
+        return
+    for i in idx[:-1]:
+        obj = obj[i]
+    obj[idx[-1]] = value
 
 
 class FuncCallStmt(Statement):
+    '''
+    Call of a function, `param_list` holds a list of arguments per call of a chain(f(x)(y)).
+    `tail` is set by the resolver when the value of the call is the value of the function body
+    it belongs to, the last call of the chain then returns a `TailCall`.
+    `declared` is set by the parser when the program declares a function named `func_name`,
+    which is then called instead of the builtin of the same name
+    '''
+
     def __init__(self, func_name, param_list):
         self.func_name = func_name
         self.param_list = param_list
+        self.kind = None
+        self.slot = None
+        self.tail = None
+        self.declared = False
 
     def __repr__(self):
         return 'Function Call for: {}({})'.format(self.func_name, self.param_list)
 
+    def calls_builtin(self):
+        return not self.declared and isinstance(self.func_name, str) and self.func_name in func_list
+
     def eval(self, env, call_frame=None):
-        self.param_list = list(map(lambda x: [] if x is None else x, self.param_list))
-        if not self.param_list:
-            self.param_list = ()
+        groups = [[] if p is None else p for p in self.param_list] or [[]]
         if isinstance(self.func_name, LambdaDeclareStmt):
-            self.func_name = self.func_name.eval(env, call_frame).name
-        if self.param_list:
-            if type(self.param_list[0]) == list and len(self.param_list) == 1:
-                # If it's not a chain call
-                self.param_list = self.param_list[0]
-            if len(self.param_list) > 1 and type(self.param_list[0]) == list:
-                # chain call
-                result = FuncCallStmt(self.func_name, self.param_list[0]).eval(env, call_frame)
-                for ps in self.param_list[1:]:
-                    result = FuncCallStmt(result.name, ps).eval(env, result.caller_id)
-                return result
-            elif self.param_list[0] is None:
-                self.param_list = ()
-        if call_frame:
-            # func = env[call_frame].get(self.func_name)
+            func = self.func_name.eval(env, call_frame)
+        elif not self.declared and self.func_name in func_list:
+            # built-in functions
+            result = call_built_in(self.func_name, tuple(p.eval(env, call_frame=call_frame) for p in groups[0]))
+            return self.chain(env, call_frame, result, groups)
+        elif call_frame:
             'Find the function according to the context'
-            func = find_variable(env, call_frame, self.func_name)
-            if func:
-                func.caller_id = call_frame
+            func = read_variable(env, call_frame, self.func_name, self.kind, self.slot)
+            if isinstance(func, Func):
+                func.caller = call_frame
         else:
             func = env.get(self.func_name)
-        if self.func_name not in func_list and (not func or not isinstance(func, Func)):
-            import sys
-            sys.stderr.write('callable object {} is not declared'.format(self.func_name))
-            exit(-1)
-        else:
-            if call_frame is not None and func is not None and self.func_name == func.name:
-                # If the func call is recursive, create a new function to create a new context
-                func = Func(self.func_name, func.param, func.body, caller=call_frame)
-            if call_frame is None and func is not None:
-                func = Func(self.func_name, func.param, func.body, caller=None)
-            if self.func_name in func_list:
-                # built-in functions
-                func = Func(self.func_name, None, None)
-            elif len(func.param) != len(self.param_list):
-                raise Exception('Invalid func call @ {}'.format(func.name))
-            return func.eval(env, self.param_list, call_frame=call_frame)
+        if not isinstance(func, Func):
+            raise Exception('callable object {} is not declared'.format(self.func_name))
+        if len(func.param) != len(groups[0]):
+            raise Exception('Invalid func call @ {}'.format(func.name))
+        args = [p.eval(env, call_frame=call_frame) for p in groups[0]]
+        if self.tail and len(groups) == 1:
+            return TailCall(func, args, call_frame, env)
+        result = func.eval(env, args, call_frame=call_frame)
+        return self.chain(env, call_frame, result, groups)
+
+    def chain(self, env, call_frame, result, groups):
+        'Chain call(f()()): following calls run in the context the returned function is bound to'
+        for ps in groups[1:]:
+            if not isinstance(result, Func):
+                raise Exception('{} is not callable'.format(result))
+            if len(result.param) != len(ps):
+                raise Exception('Invalid func call @ {}'.format(result.name))
+            args = [p.eval(env, call_frame=call_frame) for p in ps]
+            if self.tail and ps is groups[-1]:
+                return TailCall(result, args, result.caller, env)
+            result = result.eval(env, args, call_frame=result.caller)
+        return result
 
 
 class FuncDeclareStmt(Statement):
@@ -570,34 +971,37 @@ class FuncDeclareStmt(Statement):
         self.name = name
         self.param = tuple(param) if param else ()
         self.body = body
+        self.scope = None
+        self.slot = None
 
     def __repr__(self):
         return 'Function-Declaration: {}{}'.format(self.name, self.param)
 
     def eval(self, env, call_frame=None):
+        if self.scope is None:
+            from resolver import resolve_function
+            resolve_function(self)
+        func = Func(self.name, self.param, self.body, caller=call_frame, scope=self.scope)  # For closure
         if call_frame:
-            env[call_frame][self.name] = Func(self.name, self.param, self.body)
-            env[call_frame][self.name].caller_id = call_frame  # For closure
+            call_frame.values[self.slot] = func
         else:
-            env[self.name] = Func(self.name, self.param, self.body)
+            env[self.name] = func
 
 
 class LambdaDeclareStmt(Statement):
     def __init__(self, param, body):
         self.param = tuple(param) if param else ()
         self.body = body
+        self.scope = None
 
     def __repr__(self):
         return 'Lambda-Decl: {}'.format(self.param)
 
     def eval(self, env, call_frame=None):
-        if call_frame:
-            env[call_frame][str(id(self))] = Lambda(str(id(self)), self.param, self.body)
-            env[call_frame][str(id(self))].caller_id = call_frame
-            return env[call_frame][str(id(self))]
-        else:
-            env[str(id(self))] = Lambda(str(id(self)), self.param, self.body)
-            return env[str(id(self))]
+        if self.scope is None:
+            from resolver import resolve_function
+            resolve_function(self)
+        return Lambda(str(id(self)), self.param, self.body, caller=call_frame, scope=self.scope)
 
 
 class ArrayInitStmt(Statement):
@@ -0,0 +1,129 @@
+'''
+On-disk cache of parsed programs.
+The AST of `foo.ty` is pickled into `foo.tyc`, or into `cache_dir` when one is given.
+A cache file starts with a key made of the hash of the source and of the interpreter
+version(see `interpreter_version`), so a file whose key does not match is ignored and rewritten
+'''
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+
+import lexer
+import profiler
+from tiny_parser import ty_parse
+
+magic = b'TYC\x01'
+
+# Modules whose source decides the trees built by the parser
+parser_modules = ['ast.py', 'combinators.py', 'lexer.py', 'tiny_parser.py', 'ty_token.py']
+
+# Deepest recursion allowed while pickling a tree, deeper trees are not cached
+pickle_depth = 20000
+
+_interpreter_version = None
+
+
+def interpreter_version():
+    'Digest of the parser modules and of the Python version, computed once per process'
+    global _interpreter_version
+    if _interpreter_version is None:
+        digest = hashlib.sha256(magic + repr(sys.version_info[:2]).encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in parser_modules:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _interpreter_version = digest.digest()
+    return _interpreter_version
+
+
+def source_key(filename):
+    'Cache key of a source file: hash of its content and of the interpreter version'
+    digest = hashlib.sha256(interpreter_version())
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data)
+    return magic + digest.digest()
+
+
+def cache_path(filename, cache_dir=None):
+    if cache_dir is None:
+        return os.path.splitext(filename)[0] + '.tyc'
+    # Sources with the same name in different directories get different cache files
+    location = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, '{}-{}.tyc'.format(name, location))
+
+
+def load(path, key):
+    'The tree cached in `path` under `key`, None when there is none'
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(key)) != key:
+                return None
+            return pickle.load(f)
+    except Exception:
+        # A corrupt file fails in many ways(ValueError, UnicodeDecodeError, AttributeError...),
+        # it is treated as a miss and rewritten
+        return None
+
+
+def store(path, key, tree):
+    '''
+    Write the cache file, replacing the previous one at once. Failures are ignored,
+    the program then simply runs without cache
+    '''
+    directory = os.path.dirname(path) or '.'
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    # Pickling recurses along nested statements and expressions
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, pickle_depth))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(key)
+            pickle.dump(tree, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except (OSError, RecursionError, pickle.PicklingError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def parse(filename, phases=None):
+    'Parse the source file, the lexing and parsing times are added to `phases` when it is given'
+    tokens = lexer.iter_file_tokens(filename)
+    if phases is not None:
+        # Tokens are read by the parser as it goes, the time spent producing them is the lexing time
+        tokens = phases.timed('lex', tokens)
+    with profiler.phase(phases, 'parse'):
+        return ty_parse(tokens)
+
+
+def parse_file(filename, use_cache=True, cache_dir=None, phases=None):
+    '''
+    AST of the program in `filename`, None on a syntax error.
+    With `use_cache` the tree is loaded from its cache file when the source has not changed,
+    otherwise the source is parsed and the cache file written.
+    `phases` is the `profiler.Phases` the steps are timed in, if any
+    '''
+    if not use_cache:
+        result = parse(filename, phases)
+        return result.value if result else None
+    with profiler.phase(phases, 'load cache'):
+        key = source_key(filename)
+        path = cache_path(filename, cache_dir)
+        tree = load(path, key)
+    if tree is not None:
+        return tree
+    result = parse(filename, phases)
+    if not result:
+        return None
+    with profiler.phase(phases, 'store cache'):
+        store(path, key, result.value)
+    return result.value
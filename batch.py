@@ -0,0 +1,120 @@
+'''
+Batch runs of one program over many inputs(`tiny.py --batch prog.ty inputs...`).
+The program is parsed and compiled once, then a pool of worker processes runs it once per input
+file, the file being the stdin read by `scan()` and the builtins of `buffered_input`.
+Workers are forked when the platform allows it: they share the tree and the compiled code
+of the parent copy-on-write instead of loading the program again.
+The output of every run is captured and handed back to the parent, in the order of the inputs.
+A run that fails is reported with its input and the other runs go on
+'''
+import gc
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+from interpreter import Program
+
+clock = time.perf_counter
+
+# `Program` run by the workers, set in the parent before forking
+program = None
+
+
+class Outcome:
+    'Result of the run of the program on one input, `error` is None when the run succeeded'
+    __slots__ = ['input', 'output', 'error', 'seconds']
+
+    def __init__(self, input, output, error, seconds):
+        self.input = input
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+
+    def __repr__(self):
+        return 'Outcome of {}: {}'.format(self.input, 'failed' if self.error else 'ok')
+
+
+def start_worker(tree, engine):
+    'Initializer of the workers, the ones that are not forked compile the program themselves'
+    global program
+    if program is None:
+        program = Program(tree, engine)
+
+
+def run_input(filename):
+    'Run the program with the file `filename` as stdin, its output is captured'
+    output = io.StringIO()
+    error = None
+    start = clock()
+    try:
+        with open(filename, 'rb') as f:
+            program.run(f, output)
+    except Exception as e:
+        # The output printed before the failure is kept
+        error = '{}: {}'.format(type(e).__name__, e)
+    return Outcome(filename, output.getvalue(), error, clock() - start)
+
+
+def context():
+    'Context of the pool, forking when the platform allows it'
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def run_batch(tree, engine, inputs, jobs=None):
+    '''
+    Generator of the `Outcome` of the run of `tree` on every file of `inputs`, in their order.
+    `jobs` is the number of worker processes, the number of CPUs by default. With one job the
+    inputs are run in the current process
+    '''
+    global program
+    jobs = jobs or os.cpu_count() or 1
+    program = Program(tree, engine)
+    if jobs == 1 or len(inputs) <= 1:
+        for filename in inputs:
+            yield run_input(filename)
+        return
+    mp = context()
+    if mp.get_start_method() == 'fork':
+        # Objects created so far are left out of the collections of the workers, which would write to their pages
+        gc.freeze()
+    else:
+        # The program is compiled again by every worker
+        program = None
+    # Inputs are handed out several at a time, a few chunks per worker
+    chunk_size = max(1, len(inputs) // (jobs * 4))
+    try:
+        with mp.Pool(jobs, start_worker, (tree, engine)) as pool:
+            yield from pool.imap(run_input, inputs, chunk_size)
+    finally:
+        gc.unfreeze()
+
+
+def main(tree, engine, inputs, jobs=None, output_dir=None):
+    '''
+    Run `tree` on every file of `inputs`. The outputs are written in `output_dir`(`name.out` for
+    the input `name`), or else on stdout after a `==> name <==` line. Failures and the throughput
+    are reported on stderr. Returns the number of runs that failed
+    '''
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    failed = 0
+    start = clock()
+    for outcome in run_batch(tree, engine, inputs, jobs):
+        if output_dir is not None:
+            with open(os.path.join(output_dir, os.path.basename(outcome.input) + '.out'), 'w') as f:
+                f.write(outcome.output)
+        else:
+            sys.stdout.write('==> {} <==\n{}'.format(outcome.input, outcome.output))
+        if outcome.error is not None:
+            failed += 1
+            sys.stdout.flush()
+            sys.stderr.write('{}: {}\n'.format(outcome.input, outcome.error))
+    elapsed = clock() - start
+    sys.stdout.flush()
+    sys.stderr.write('{} input(s), {} failed, {:.3f}s, {:.1f} inputs/s\n'.format(
+        len(inputs), failed, elapsed, len(inputs) / elapsed if elapsed else 0.0))
+    return failed
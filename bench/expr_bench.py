@@ -0,0 +1,64 @@
+'''
+Parsing time of expression-heavy programs: precedence climbing(`combinators.Precedence`)
+against the original chain of one `Exp` combinator per precedence level.
+Usage: python bench/expr_bench.py [lines ...]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.setrecursionlimit(100000)
+
+import lexer
+import programs
+import tiny_parser
+from combinators import Exp
+
+repeat = 5
+
+
+def nested_precedence(value_parser, precedence_level, post_processor):
+    'The original `tiny_parser.precedence_combinator`'
+    ret = value_parser * (tiny_parser.get_parser_from_list(precedence_level[0]) ^ post_processor)
+    for i in precedence_level[1:]:
+        ret = ret * (tiny_parser.get_parser_from_list(i) ^ post_processor)
+    return ret
+
+
+def use_combinator(combinator):
+    'Build the grammar again with `combinator` in place of `tiny_parser.precedence_combinator`'
+    tiny_parser.precedence_combinator = combinator
+    tiny_parser.rebuild_grammar()
+
+
+def best_time(func):
+    'Fastest of `repeat` runs, the least disturbed by the rest of the system'
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(sizes):
+    climbing = tiny_parser.precedence_combinator
+    print('{:>7} {:>8} {:>6} {:>11} {:>12} {:>8}'.format(
+        'lines', 'tokens', 'memo', 'nested(s)', 'climbing(s)', 'speedup'))
+    for lines in sizes:
+        tokens = lexer.tokenize(programs.generate_expressions(lines))
+        for memoize in (False, True):
+            parse = lambda: tiny_parser.ty_parse(tokens, memoize=memoize)
+            use_combinator(nested_precedence)
+            expected = parse()
+            nested = best_time(parse)
+            use_combinator(climbing)
+            assert repr(parse().value) == repr(expected.value)
+            climb = best_time(parse)
+            print('{:>7} {:>8} {:>6} {:>11.3f} {:>12.3f} {:>7.1f}x'.format(
+                lines, len(tokens), 'on' if memoize else 'off', nested, climb, nested / climb))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [50, 200, 800])
@@ -0,0 +1,41 @@
+'''
+Tokenizing time of generated programs: `lexer.tokenize` against the original `lexer.advanced_parse`.
+Usage: python bench/lex_bench.py [blocks ...]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexer
+import programs
+
+repeat = 3
+
+
+def best_time(func):
+    'Fastest of `repeat` runs, the least disturbed by the rest of the system'
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(sizes):
+    print('{:>7} {:>9} {:>8} {:>12} {:>12} {:>8}'.format(
+        'blocks', 'bytes', 'tokens', 'original(s)', 'tokenize(s)', 'speedup'))
+    for blocks in sizes:
+        source = programs.generate(blocks)
+        tokens = lexer.tokenize(source)
+        assert tokens == lexer.advanced_parse(source)
+        original = best_time(lambda: lexer.advanced_parse(source))
+        new = best_time(lambda: lexer.tokenize(source))
+        print('{:>7} {:>9} {:>8} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            blocks, len(source), len(tokens), original, new, original / new))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10, 100, 1000, 5000])
@@ -0,0 +1,43 @@
+'''
+Parsing time of generated programs with and without packrat memoization.
+Usage: python bench/parse_bench.py [blocks ...]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.setrecursionlimit(100000)
+
+import lexer
+import programs
+from tiny_parser import ty_parse, memo_table
+
+repeat = 5
+
+
+def best_time(func):
+    'Fastest of `repeat` runs, the least disturbed by the rest of the system'
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(sizes):
+    print('{:>7} {:>8} {:>10} {:>10} {:>12} {:>12}'.format(
+        'blocks', 'tokens', 'plain(s)', 'memo(s)', 'plain(us/t)', 'memo(us/t)'))
+    for blocks in sizes:
+        tokens = lexer.tokenize(programs.generate(blocks))
+        assert ty_parse(tokens, memoize=False) is not None
+        plain = best_time(lambda: ty_parse(tokens, memoize=False))
+        memo = best_time(lambda: ty_parse(tokens, memoize=True))
+        print('{:>7} {:>8} {:>10.3f} {:>10.3f} {:>12.2f} {:>12.2f}'.format(
+            blocks, len(tokens), plain, memo, plain / len(tokens) * 1e6, memo / len(tokens) * 1e6))
+    print('memo table bound: {} results'.format(memo_table.max_size))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10, 50, 100, 200, 400])
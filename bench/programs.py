@@ -0,0 +1,83 @@
+'''
+Generators of large Tiny programs used by the benchmarks.
+The generated programs parse and run on every engine.
+'''
+
+block_template = '''\
+func max_{n}(x, y) =>
+    if x > y then
+        return x
+    else
+        return y
+    end
+end
+
+func sum_{n}(arr, size) =>
+    total := 0
+    for (i := 0; i < size; i := i + 1) do
+        total := total + arr[i] * 2 - (arr[i] shr 1) + max_{n}(i % 7, 3)
+    end
+    return total
+end
+
+<* block {n}: <* nested *> comment *>
+data_{n} := array(16, {n} % 5)
+k_{n} := 0
+while k_{n} < 16 andalso not (k_{n} = 100) do
+    data_{n}[k_{n}] := (k_{n} * 3 + 1) % 11
+    k_{n} := k_{n} + 1
+end
+if ((k_{n} > 1) andalso (((k_{n} + 1) * 2) > ((3)))) orelse not ((k_{n} - 1) = (2 * (1 + 1))) then
+    k_{n} := ~k_{n}
+end
+scale_{n} := {{(v) => return v * 2 + 1}}
+r_{n} := scale_{n}(sum_{n}(data_{n}, 16)) + 0.5
+'''
+
+
+def generate(blocks):
+    'Return the source of a program made of `blocks` independent blocks of functions and statements'
+    source = ''.join(block_template.format(n=n) for n in range(blocks))
+    checks = ' + '.join('r_{}'.format(n) for n in range(min(blocks, 50)))
+    return source + 'print({})\n'.format(checks)
+
+
+def random_aexp(rng, depth):
+    'Arithmetic expression over a, b and c mixing every level of `arithmetic_exp_levels`'
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice(['a', 'b', 'c', str(rng.randint(0, 99))])
+    op = rng.choice(['+', '-', '*', '%', 'div', 'shl', 'shr', '|', '&', '^'])
+    left = random_aexp(rng, depth - 1)
+    if op in ('%', 'div'):
+        right = str(rng.randint(1, 9))
+    elif op in ('shl', 'shr'):
+        right = str(rng.randint(0, 3))
+    else:
+        right = random_aexp(rng, depth - 1)
+    source = '{} {} {}'.format(left, op, right)
+    # A divisor or shift count must not become the left operand of a tighter operator
+    return '({})'.format(source) if op in ('%', 'div', 'shl', 'shr') or rng.random() < 0.3 else source
+
+
+def random_bexp(rng, depth):
+    'Boolean expression made of comparisons joined by andalso, orelse and not'
+    if depth == 0 or rng.random() < 0.3:
+        return '{} {} {}'.format(random_aexp(rng, 2), rng.choice(['>', '<', '>=', '<=', '=', '!=']),
+                                 random_aexp(rng, 2))
+    if rng.random() < 0.2:
+        return 'not ({})'.format(random_bexp(rng, depth - 1))
+    return '{} {} {}'.format(random_bexp(rng, depth - 1), rng.choice(['andalso', 'orelse']),
+                             random_bexp(rng, depth - 1))
+
+
+def generate_expressions(lines, seed=0):
+    'Return the source of a program of `lines` assignments and conditions made of long expressions'
+    import random
+    rng = random.Random(seed)
+    source = ['a := 7', 'b := 3', 'c := 12', 'hits := 0']
+    for n in range(lines):
+        target = 'abc'[n % 3]
+        source.append('{} := ({}) % 1000'.format(target, random_aexp(rng, 4)))
+        source.append('if {} then\n    hits := hits + 1\nend'.format(random_bexp(rng, 3)))
+    source.append('print(a + b + c + hits)')
+    return '\n'.join(source) + '\n'
@@ -0,0 +1,250 @@
+'''
+Benchmark suite of the programs of `examples/`, run on generated inputs of several sizes.
+Lexing and parsing are timed once per program, evaluation once per program, input size and engine.
+Every measure is repeated(see `measure`), the median and percentiles of the runs are reported, and the results
+can be written as JSON(`--json`) and compared with the results of another commit(`--compare`).
+The inputs are generated from a fixed seed, so two runs time the same work; the digest of
+the output of every run is recorded as well, a change of output shows up in the comparison.
+Usage:
+    python bench/suite.py [--repeat=n] [--engines=tree,vm,python] [--programs=Fibonacci,...] [--json=file]
+    python bench/suite.py --compare base.json new.json
+'''
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, root)
+sys.setrecursionlimit(100000)
+
+# The tree walker module first, the builtin modules are imported while it is initialized
+import ast
+import buffered_input
+import buffered_output
+import lexer
+import optimizer
+from runtime import run_deep
+from tiny_parser import ty_parse
+
+repeat = 5
+
+min_sample = 0.02
+
+seed = 20170817
+
+percentiles = [10, 50, 90]
+
+
+def lines(values):
+    return ''.join('{}\n'.format(v) for v in values)
+
+
+def fibonacci_input(rng, size):
+    return lines([size])
+
+
+def heap_input(rng, size):
+    'The heap of the program holds 99 elements at most'
+    return lines([size] + [rng.randint(-1000, 1000) for _ in range(size)])
+
+
+def interval_tree_input(rng, size):
+    'The tree of the program holds 2500 leaves at most, it answers 5 queries'
+    queries = []
+    for _ in range(5):
+        a = rng.randint(1, size)
+        queries += [a, rng.randint(a, size)]
+    return lines([size] + [rng.randint(0, 10 ** 6) for _ in range(size)] + queries)
+
+
+def union_find_input(rng, size):
+    '`size` operations on the 19 sets the program holds'
+    n = 19
+    ops = []
+    for _ in range(size):
+        ops += [rng.randint(1, 2), rng.randint(1, n), rng.randint(1, n)]
+    return lines([n, size] + ops)
+
+
+def no_input(rng, size):
+    return ''
+
+
+# Program name: (input generator, input sizes)
+benchmarks = {
+    'Fibonacci': (fibonacci_input, [12, 16, 20]),
+    'Heap': (heap_input, [25, 50, 99]),
+    'IntervalTree': (interval_tree_input, [250, 1000, 2500]),
+    'Union_Find': (union_find_input, [50, 200, 800]),
+    'Lambda': (no_input, [1]),
+}
+
+
+def percentile(samples, p):
+    'Linearly interpolated p-th percentile'
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * p / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summary(samples):
+    result = {'p{}'.format(p): percentile(samples, p) for p in percentiles}
+    result['median'] = result.pop('p50')
+    result['min'] = min(samples)
+    result['max'] = max(samples)
+    result['samples'] = samples
+    return result
+
+
+def measure(func, prepare=None):
+    '''
+    Seconds per run of func(), or of func(prepare()) when `prepare` is given, which is not timed.
+    `repeat` samples are taken after a first run, short functions are run several times
+    per sample so that a sample lasts `min_sample` seconds at least
+    '''
+    def timed():
+        arg = prepare() if prepare else None
+        start = time.perf_counter()
+        func(arg) if prepare else func()
+        return time.perf_counter() - start
+
+    loops = max(1, math.ceil(min_sample / max(timed(), 1e-9)))
+    return [sum(timed() for _ in range(loops)) / loops for _ in range(repeat)]
+
+
+def execute(tree, engine):
+    'Run a tree in a new global environment'
+    env = {}
+    if engine == 'vm':
+        import vm
+        return vm.execute(tree, env)
+    if engine == 'python':
+        import transpiler
+        return run_deep(transpiler.execute, tree, env)
+    return run_deep(tree.eval, env)
+
+
+def evaluate(tree, engine, data):
+    'Run a tree with `data` as stdin and return its output'
+    stdout = sys.stdout
+    sys.stdout = output = io.StringIO()
+    buffered_input.stdin = buffered_input.BufferedInput(io.BytesIO(data.encode()))
+    try:
+        execute(tree, engine)
+        buffered_output.flush()
+    finally:
+        sys.stdout = stdout
+        buffered_input.stdin = None
+    return output.getvalue()
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, engines):
+    results = []
+    for name in names:
+        generator, sizes = benchmarks[name]
+        with open(os.path.join(root, 'examples', name + '.ty')) as f:
+            source = f.read()
+        tokens = lexer.tokenize(source)
+        tree = ty_parse(tokens).value
+        results.append(dict(program=name, phase='lex', size=None, engine=None,
+                            **summary(measure(lambda: lexer.tokenize(source)))))
+        results.append(dict(program=name, phase='parse', size=None, engine=None,
+                            **summary(measure(lambda: ty_parse(tokens)))))
+        # The engines annotate the tree they run, every run gets a fresh copy
+        optimized = pickle.dumps(optimizer.optimize(tree))
+        for size in sizes:
+            data = generator(random.Random('{}-{}-{}'.format(seed, name, size)), size)
+            for engine in engines:
+                outputs = set()
+                times = measure(lambda t: outputs.add(evaluate(t, engine, data)), lambda: pickle.loads(optimized))
+                if len(outputs) != 1:
+                    raise Exception('{} gave different outputs on the same input'.format(name))
+                digest = hashlib.sha256(outputs.pop().encode()).hexdigest()[:16]
+                results.append(dict(program=name, phase='eval', size=size, engine=engine, output=digest,
+                                    **summary(times)))
+    return results
+
+
+def label(result):
+    parts = [result['program'], result['phase']]
+    if result['size'] is not None:
+        parts.append('n={}'.format(result['size']))
+    if result['engine'] is not None:
+        parts.append(result['engine'])
+    return ' '.join(parts)
+
+
+def report(results):
+    print('{:<36} {:>11} {:>11} {:>11}'.format('benchmark', 'p10(s)', 'median(s)', 'p90(s)'))
+    for result in results:
+        print('{:<36} {:>11.6f} {:>11.6f} {:>11.6f}'.format(label(result), result['p10'], result['median'],
+                                                          result['p90']))
+
+
+def compare(base_file, new_file):
+    'Print the ratio of the medians of two result files, the benchmarks are matched by label'
+    with open(base_file) as f:
+        base = {label(r): r for r in json.load(f)['results']}
+    with open(new_file) as f:
+        new = json.load(f)['results']
+    print('{:<36} {:>11} {:>11} {:>8}'.format('benchmark', 'base(s)', 'new(s)', 'speedup'))
+    for result in new:
+        old = base.get(label(result))
+        if old is None:
+            continue
+        note = ''
+        if old.get('output') != result.get('output'):
+            note = ' output changed'
+        print('{:<36} {:>11.6f} {:>11.6f} {:>7.2f}x{}'.format(label(result), old['median'], result['median'],
+                                                           old['median'] / result['median'], note))
+
+
+def main():
+    global repeat
+    arg_parser = argparse.ArgumentParser(prog='suite')
+    arg_parser.add_argument('--repeat', type=int, default=repeat)
+    arg_parser.add_argument('--engines', default='tree')
+    arg_parser.add_argument('--programs', default=','.join(benchmarks))
+    arg_parser.add_argument('--json', metavar='file')
+    arg_parser.add_argument('--compare', nargs=2, metavar=('base', 'new'))
+    args = arg_parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    repeat = args.repeat
+    results = run(args.programs.split(','), args.engines.split(','))
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': commit(),
+                'python': platform.python_version(),
+                'repeat': repeat,
+                'seed': seed,
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+'''
+Input builtins reading stdin through one buffer.
+The input is read in chunks of `chunk_size` bytes instead of one `input()` call per value,
+the pending output is flushed before each read(see `buffered_output`).
+`scan()` reads a line, the typed readers read whitespace separated tokens,
+and both can be mixed in the same program
+'''
+import array
+import io
+import re
+import sys
+
+import ast
+import buffered_output
+
+chunk_size = 1 << 16
+
+whitespace = b' \t\n\r\x0b\x0c'
+
+token_pattern = re.compile(rb'\s*(\S+)')
+
+
+class BufferedInput:
+    '''
+    Reader of a binary stream. `data[pos:]` holds what is read from the stream but not consumed yet,
+    `eof` tells whether the stream is exhausted
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        # `read1` returns what is available instead of waiting for a full chunk
+        self.read = getattr(stream, 'read1', stream.read)
+        self.data = b''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        'Read the next chunk, False at the end of the stream'
+        if self.eof:
+            return False
+        # What was printed so far is shown before waiting for input
+        buffered_output.flush()
+        chunk = self.read(chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.data = self.data[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def line(self):
+        'Next line without its line break, like `input()`'
+        while True:
+            end = self.data.find(b'\n', self.pos)
+            if end >= 0:
+                line = self.data[self.pos:end]
+                self.pos = end + 1
+                return line.rstrip(b'\r')
+            if not self.more():
+                if self.pos == len(self.data):
+                    raise EOFError('EOF when reading a line')
+                line = self.data[self.pos:]
+                self.pos = len(self.data)
+                return line
+
+    def token(self):
+        'Next whitespace separated token, the whitespace after it is left for the next read'
+        while True:
+            match = token_pattern.match(self.data, self.pos)
+            # A token reaching the end of the buffer may go on in the next chunk
+            if match and (match.end() < len(self.data) or self.eof):
+                self.pos = match.end()
+                return match.group(1)
+            if self.eof:
+                raise EOFError('EOF when reading a value')
+            self.more()
+
+    def tokens(self, count):
+        'Next `count` tokens, split a chunk at a time'
+        if count < 0:
+            raise ValueError('Cannot read {} values'.format(count))
+        result = []
+        while True:
+            # End of the last token known to be complete
+            end = len(self.data) if self.eof else max(self.data.rfind(c, self.pos) for c in whitespace) + 1
+            need = count - len(result)
+            parts = self.data[self.pos:end].split(None, need)
+            if len(parts) > need:
+                # The whitespace before the rest is removed by `split`
+                end -= len(parts.pop())
+            result.extend(parts)
+            self.pos += len(self.data[self.pos:end].rstrip())
+            if len(result) == count:
+                return result
+            if self.eof:
+                raise EOFError('EOF when reading {} values'.format(count))
+            self.more()
+
+
+stdin = None
+
+
+def reader():
+    'Reader of `sys.stdin`, created at the first read'
+    global stdin
+    if stdin is None:
+        if hasattr(sys.stdin, 'buffer'):
+            stdin = BufferedInput(sys.stdin.buffer)
+        else:
+            # A text stream put in place of stdin, e.g. by a test
+            stdin = BufferedInput(io.BytesIO(sys.stdin.read().encode()))
+    return stdin
+
+
+def decode(data):
+    return data.decode(getattr(sys.stdin, 'encoding', None) or 'utf-8')
+
+
+def typed_array(values, kind):
+    'Array of `values`, typed when possible(see `ast.ArrayBuffer`)'
+    try:
+        buffer = ast.ArrayBuffer(array.array(ast.ArrayBuffer.typecodes[kind], values), kind)
+    except OverflowError:
+        buffer = ast.ArrayBuffer(list(values))
+    return ast.Array.view(buffer, 0, (len(values),))
+
+
+def scan():
+    'Next line of the input'
+    return decode(reader().line())
+
+
+def scan_int():
+    return int(reader().token())
+
+
+def scan_double():
+    return float(reader().token())
+
+
+def scan_ints(count):
+    'Array of the next `count` ints of the input'
+    return typed_array(list(map(int, reader().tokens(count))), int)
+
+
+def scan_doubles(count):
+    'Array of the next `count` doubles of the input'
+    return typed_array(list(map(float, reader().tokens(count))), float)
+
+
+functions = {
+    'scan': scan,
+    'scan_int': scan_int,
+    'scan_double': scan_double,
+    'scan_ints': scan_ints,
+    'scan_doubles': scan_doubles,
+}
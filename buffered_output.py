@@ -0,0 +1,40 @@
+'''
+Output of the print builtin.
+Text is collected and written to stdout once `flush_size` characters are pending,
+before input is read from stdin(see `buffered_input`) and when the program exits.
+With `unbuffered` set, every print is written and flushed at once.
+The output goes to `stream` instead of stdout when it is set(see `interpreter.Program.run`)
+'''
+import atexit
+import sys
+
+flush_size = 1 << 16
+
+unbuffered = False
+
+stream = None
+
+pending = []
+pending_size = 0
+
+
+def write(text):
+    global pending_size
+    pending.append(text)
+    pending_size += len(text)
+    if unbuffered or pending_size >= flush_size:
+        flush()
+
+
+def flush():
+    global pending_size
+    out = sys.stdout if stream is None else stream
+    if pending:
+        text = ''.join(pending)
+        pending.clear()
+        pending_size = 0
+        out.write(text)
+    out.flush()
+
+
+atexit.register(flush)
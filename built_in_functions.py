@@ -1,24 +1,120 @@
-from math import *
-from random import *
-from ast import *
+'''
+Registry of the builtin functions.
+`registry` maps each builtin name to the Python callable running it, and is built once
+at import: a builtin call is a dict lookup and a call. The functions of `math` and `random`
+are builtins, along with print, int, len and the builtins of `array_builtins`, `buffered_input` and `memo`.
+A function declared by a program shadows the builtin of the same name(see `FuncCallStmt.declared`)
+'''
+import math
+import random
 
-func_list = dir() + ['println', 'print', 'scan', 'int', 'len']
+# Imported by `ast` while it is being initialized: the modules below only read its names at call time
+import array_builtins
+import buffered_input
+import buffered_output
+import memo
 
 
-def scan():
-    return input()
+def public_functions(module):
+    'Callables brought in by `from module import *`'
+    names = getattr(module, '__all__', None) or [n for n in dir(module) if not n.startswith('_')]
+    return {n: getattr(module, n) for n in names if callable(getattr(module, n))}
 
 
-def call_built_in(func_name, param):
-    if func_name not in func_list:
-        sys.stderr.write('function {} is not defined'.format(func_name))
-        sys.exit(-1)
+def tiny_print(*values):
+    buffered_output.write(''.join([str(i) + ' ' for i in values]) + '\n')
+
+
+def length(arr):
+    return arr.size
+
+
+registry = {}
+registry.update(public_functions(math))
+registry.update(public_functions(random))
+registry.update(array_builtins.functions)
+registry.update(buffered_input.functions)
+registry.update(memo.functions)
+registry.update({
+    'print': tiny_print,
+    'println': tiny_print,
+    'int': int,
+    'len': length,
+})
+
+# Names of the builtins, tested with `name in func_list` by the engines
+func_list = registry
+
+# Builtins whose value only depends on their arguments, which memoized functions may call(see `memo.py`)
+pure_functions = set(public_functions(math)) | {'int', 'sum', 'min', 'max'}
+
+arities = {}
+
+
+def signature_arity(func):
+    '''
+    (least, most) numbers of positional arguments of a callable, read from its code object or
+    from the text signature of a C function. `inspect` is not used: it imports the standard `ast`,
+    which the tree walker module shadows
+    '''
+    code = getattr(getattr(func, '__func__', func), '__code__', None)
+    if code is not None:
+        bound = 1 if hasattr(func, '__self__') else 0
+        most = code.co_argcount - bound
+        least = most - len(getattr(func, '__defaults__', None) or ())
+        return least, None if code.co_flags & 0x04 else most
+    text = getattr(func, '__text_signature__', None)
+    if not text:
+        return None
+    least, most = 0, 0
+    for p in text.strip('()').split(','):
+        p = p.strip()
+        if p.startswith('$') or p == '/':
+            continue
+        if p.startswith('*'):
+            if p != '*':
+                most = None
+            break
+        if '=' not in p:
+            least += 1
+        most += 1
+    return least, most
+
+
+def arity(func_name):
+    '''
+    Least and most numbers of arguments taken by a builtin, the most is None when there is no limit.
+    None when the signature of the callable is not known(e.g. `math.log`)
+    '''
+    if func_name not in arities:
+        arities[func_name] = signature_arity(registry[func_name])
+    return arities[func_name]
+
+
+def check_arity(func_name, count):
+    'Raise when a builtin does not take `count` arguments'
+    bounds = arity(func_name)
+    if bounds is None:
+        return
+    least, most = bounds
+    if least <= count and (most is None or count <= most):
+        return
+    if least == most:
+        expected = least
+    elif most is None:
+        expected = 'at least {}'.format(least)
     else:
-        if func_name == 'print':
-            for i in param:
-                print(i, end=' ')
-            print()
-            return None
-        elif func_name == 'len':
-            return param[0].size
-        return eval(func_name + str(tuple(param)))
+        expected = '{} to {}'.format(least, most)
+    raise Exception('{} takes {} argument(s), {} given'.format(func_name, expected, count))
+
+
+def call_built_in(func_name, param):
+    func = registry.get(func_name)
+    if func is None:
+        raise Exception('function {} is not defined'.format(func_name))
+    try:
+        return func(*param)
+    except TypeError:
+        # The arity is only looked at when the call fails
+        check_arity(func_name, len(param))
+        raise
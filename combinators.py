@@ -1,3 +1,7 @@
+import threading
+from collections import OrderedDict
+
+
 class Result:
     '''
     This class stores the result parsed by parsers
@@ -13,6 +17,45 @@ class Result:
         return "Result of ({}, {})".format(self.value, self.pos)
 
 
+class TokenWindow:
+    '''
+    Token list read on demand from the iterator `source`(e.g. `lexer.iter_file_tokens`).
+    Only the tokens from `offset` on are buffered, `release` drops the ones the parser
+    will not read again, so a long token stream is never held in memory as a whole.
+    Indexing past the last token raises IndexError like a list does
+    '''
+    __slots__ = ['tokens', 'offset', 'source']
+
+    def __init__(self, source):
+        self.tokens = []
+        self.offset = 0
+        self.source = iter(source)
+
+    def __repr__(self):
+        return 'TokenWindow of {} tokens from {}'.format(len(self.tokens), self.offset)
+
+    def __getitem__(self, pos):
+        index = pos - self.offset
+        if index < 0:
+            raise LookupError('Token {} has been released'.format(pos))
+        tokens = self.tokens
+        while index >= len(tokens):
+            if self.source is None:
+                raise IndexError(pos)
+            try:
+                tokens.append(next(self.source))
+            except StopIteration:
+                self.source = None
+                raise IndexError(pos)
+        return tokens[index]
+
+    def release(self, pos):
+        '''Drop the buffered tokens before `pos`'''
+        if pos > self.offset:
+            del self.tokens[:pos - self.offset]
+            self.offset = pos
+
+
 class Parser:
     '''
     Parser base class:
@@ -26,7 +69,7 @@ class Parser:
 
         `P_a` * `P_b`
         will take `P_a` as separator and return elements on two sides of the pattern that can be parsed
-        by `P_a` into a `CompoundStmt` wrapper. This class is used to deal with left recursion
+        by `P_a` with the function returned by `P_a`. This class is used to deal with left recursion
 
         `Lazy(p_func)`
         is designed for lazy calculation, which is not natively supported by Python. The parser will
@@ -34,6 +77,17 @@ class Parser:
 
         `P_a ^ func`
         will return the result of `func`, which takes the parsed result proceeded by `P_a`
+
+        `Precedence(P_a, levels, tag, func)`
+        parses binary operations of the operators in `levels` over the operands parsed by `P_a`,
+        it replaces a chain of `Exp` when there are many levels
+
+        `Memo(P_a, key, table)`
+        caches the results of `P_a` in `table`(packrat parsing). Results are never modified
+        after they are returned, so a cached result can be shared by every parser that asks for it
+
+        `Located(P_a)`
+        gives the node returned by `P_a` the line and column of the token `P_a` starts at
     '''
     def __call__(self, value, pos):
         return None
@@ -65,8 +119,12 @@ class Reserved(Parser):
         self.tag = tag
 
     def __call__(self, tokens, pos):
-        if pos < len(tokens) and self.value == tokens[pos][0] and self.tag is tokens[pos][1]:
-            return Result(tokens[pos][0], pos + 1)
+        try:
+            token = tokens[pos]
+        except IndexError:
+            return None
+        if self.value == token[0] and self.tag is token[1]:
+            return Result(token[0], pos + 1)
         return None
 
 
@@ -80,8 +138,12 @@ class Tag(Parser):
         self.tag = tag
 
     def __call__(self, tokens, pos):
-        if pos < len(tokens) and tokens[pos][1] is self.tag:
-            return Result(tokens[pos][0], pos + 1)
+        try:
+            token = tokens[pos]
+        except IndexError:
+            return None
+        if token[1] is self.tag:
+            return Result(token[0], pos + 1)
         return None
 
 
@@ -154,8 +216,29 @@ class Process(Parser):
     def __call__(self, tokens, pos):
         result = self.parser(tokens, pos)
         if result:
-            result.value = self.func(result.value)
-            return result
+            return Result(self.func(result.value), result.pos)
+
+
+class Located(Parser):
+    '''
+    Set the position of the first token parsed on the node returned by `parser`.
+    A node that already has a position keeps it: an expression in parentheses
+    is located at its first operand
+    '''
+    __slots__ = ['parser']
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def __call__(self, tokens, pos):
+        result = self.parser(tokens, pos)
+        if result:
+            node = result.value
+            if node.line is None:
+                token = tokens[pos]
+                node.line = token[3]
+                node.column = token[4]
+        return result
 
 
 class Lazy(Parser):
@@ -183,30 +266,150 @@ class Phrase(Parser):
 
     def __call__(self, tokens, pos):
         result = self.parser(tokens, pos)
-        if result and result.pos == len(tokens):
+        if not result:
+            return None
+        try:
+            tokens[result.pos]
+        except IndexError:
             return result
         return None
 
 
 class Exp(Parser):
-    __slots__ = ['parser', 'separator']
+    '''
+    With `release` set, the tokens before each parsed element are released
+    when parsing from a `TokenWindow`. Only a parser that never backtracks
+    over its elements(the top-level statement list) may do so
+    '''
+    __slots__ = ['parser', 'separator', 'release']
 
-    def __init__(self, parser, separator):
+    def __init__(self, parser, separator, release=False):
         self.parser = parser
         self.separator = separator
+        self.release = release
 
     def __call__(self, tokens, pos):
         result = self.parser(tokens, pos)
+        window = tokens if self.release and isinstance(tokens, TokenWindow) else None
+        while result:
+            if window is not None:
+                window.release(result.pos)
+            sep = self.separator(tokens, result.pos)
+            if not sep:
+                break
+            right = self.parser(tokens, sep.pos)
+            if not right:
+                break
+            result = Result(sep.value(result.value, right.value), right.pos)
+        return result
 
-        def process_next(parsed):
-            (sepfunc, right) = parsed
-            return sepfunc(result.value, right)
 
-        next_parser = self.separator + self.parser ^ process_next
+class Precedence(Parser):
+    '''
+    Precedence climbing over binary operators, equivalent to chaining one `Exp` per level:
+        value_parser * (level_0 ^ post_processor) * (level_1 ^ post_processor) * ...
+    `levels` lists the operators(data of tokens tagged `tag`) from the tightest binding
+    level to the loosest, every operator is left associative. `post_processor(op)`
+    returns the function combining the two operands of `op`.
+    An operand is parsed once whatever the number of levels, and no parser is built while parsing
+    '''
+    __slots__ = ['value_parser', 'powers', 'tag', 'post_processor']
+
+    def __init__(self, value_parser, levels, tag, post_processor):
+        self.value_parser = value_parser
+        self.powers = {}
+        for i, level in enumerate(levels):
+            for op in level:
+                self.powers.setdefault(op, len(levels) - i)
+        self.tag = tag
+        self.post_processor = post_processor
 
-        next_result = result
-        while next_result:
-            next_result = next_parser(tokens, result.pos)
-            if next_result:
-                result = next_result
+    def __call__(self, tokens, pos):
+        result = self.value_parser(tokens, pos)
+        if not result:
+            return None
+        value, pos, _ = self.climb(tokens, result.value, result.pos, 1)
+        return Result(value, pos)
+
+    def climb(self, tokens, left, pos, min_power):
+        '''
+        Extend the operand `left` ending at `pos` with the operators binding at least as tight as `min_power`.
+        Returns (value, pos, stopped), `stopped` is set when an operator is not followed
+        by an operand, which ends the whole expression before that operator
+        '''
+        powers = self.powers
+        while True:
+            try:
+                token = tokens[pos]
+            except IndexError:
+                return left, pos, False
+            if token[1] is not self.tag:
+                return left, pos, False
+            power = powers.get(token[0])
+            if power is None or power < min_power:
+                return left, pos, False
+            combine = self.post_processor(token[0])
+            result = self.value_parser(tokens, pos + 1)
+            if not result:
+                return left, pos, True
+            right, right_pos, stopped = self.climb(tokens, result.value, result.pos, power + 1)
+            left = combine(left, right)
+            pos = right_pos
+            if stopped:
+                return left, pos, True
+
+
+class MemoTable(threading.local):
+    '''
+    Results of memoized parsers keyed by (rule key, position).
+    At most `max_size` results are kept, the least recently used ones are evicted first.
+    The table must be cleared before parsing another token list. Each thread has its own
+    results, so that token lists can be parsed by several threads at once
+    '''
+
+    def __init__(self, max_size=100000, enabled=True):
+        self.entries = OrderedDict()
+        self.max_size = max_size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'MemoTable of {} results({} hits, {} misses)'.format(len(self.entries), self.hits, self.misses)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, key, parser, tokens, pos):
+        if not self.enabled:
+            return parser(tokens, pos)
+        entries = self.entries
+        k = (key, pos)
+        if k in entries:
+            self.hits += 1
+            entries.move_to_end(k)
+            return entries[k]
+        self.misses += 1
+        result = parser(tokens, pos)
+        entries[k] = result
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
         return result
+
+
+class Memo(Parser):
+    '''
+    Packrat memoization: `key` names the rule parsed by `parser`, so every instance of a rule
+    built by the grammar functions shares the results stored in `table`
+    '''
+    __slots__ = ['parser', 'key', 'table']
+
+    def __init__(self, parser, key, table):
+        self.parser = parser
+        self.key = key
+        self.table = table
+
+    def __call__(self, tokens, pos):
+        return self.table.parse(self.key, self.parser, tokens, pos)
@@ -0,0 +1,271 @@
+from ast import *
+from resolver import resolve_function
+from runtime import BREAK
+
+'Opcodes'
+LOAD_CONST = 0
+LOAD_NAME = 1
+LOAD_GLOBAL = 2
+STORE_NAME = 3
+STORE_GLOBAL = 4
+STORE_SUBSCR = 5
+SUBSCR = 6
+BINOP = 7
+RELOP = 8
+JUMP_IF_FALSE_OR_POP = 9
+JUMP_IF_TRUE_OR_POP = 10
+XOR = 11
+NOT = 12
+NEG = 13
+COMBINE = 14
+POP = 15
+JUMP = 16
+POP_JUMP_IF_FALSE = 17
+LOOP_BODY = 18
+DECLARE_GLOBAL = 19
+MAKE_FUNCTION = 20
+MAKE_LAMBDA = 21
+MAKE_ARRAY = 22
+LOAD_CALLEE = 23
+CALL = 24
+RETURN_VALUE = 25
+LOAD_GLOBAL_CALLEE = 26
+TAIL_CALL = 27
+
+opnames = {v: k for k, v in list(globals().items()) if k.isupper() and isinstance(v, int)}
+
+class Code:
+    '''
+    Compiled body of the top-level program or of a function.
+    Instructions are (opcode, argument) pairs, jump arguments are absolute indexes.
+    `impurity` tells why the function cannot be memoized(see `resolver.impurity`)
+    '''
+    __slots__ = ['name', 'param', 'instrs', 'toplevel', 'impurity']
+
+    def __init__(self, name, param, toplevel):
+        self.name = name
+        self.param = param
+        self.instrs = []
+        self.toplevel = toplevel
+        self.impurity = None
+
+    def __repr__(self):
+        return 'Code object {} @ {}'.format(self.name, hex(id(self)))
+
+
+class Compiler:
+    '''
+    Translate the AST returned by `ty_parse` into bytecode for `vm.run`.
+    Every statement leaves exactly one value on the stack, which is the value
+    the corresponding `eval` method would return
+    '''
+
+    def __init__(self, name, param=(), toplevel=True, declared_global=()):
+        self.code = Code(name, param, toplevel)
+        # Names of `global` statements, which apply to the whole function body
+        self.declared_global = declared_global
+
+    def emit(self, op, arg=None):
+        self.code.instrs.append((op, arg))
+        return len(self.code.instrs) - 1
+
+    def label(self):
+        return len(self.code.instrs)
+
+    def patch(self, at, target):
+        op, _ = self.code.instrs[at]
+        self.code.instrs[at] = (op, target)
+
+    def compile_body(self, node):
+        self.visit(node)
+        self.emit(RETURN_VALUE)
+        return self.code
+
+    def visit(self, node):
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            raise RuntimeError('Cannot compile {}'.format(node))
+        method(node)
+
+    def is_global(self, name):
+        return self.code.toplevel or name in self.declared_global
+
+    def load(self, name):
+        self.emit(LOAD_GLOBAL if self.is_global(name) else LOAD_NAME, name)
+
+    def visit_NumAexp(self, node):
+        self.emit(LOAD_CONST, node.v)
+
+    visit_StrAexp = visit_NumAexp
+    visit_BoolAexp = visit_NumAexp
+
+    def visit_VarAexp(self, node):
+        self.load(node.name)
+
+    def visit_SubscriptExp(self, node):
+        self.load(node.obj)
+        for i in node.idx:
+            self.visit(i)
+        self.emit(SUBSCR, len(node.idx))
+
+    def visit_BinopAexp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(BINOP, node.func)
+
+    def visit_RelopBexp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(RELOP, node.func)
+
+    def visit_AndBexp(self, node):
+        self.visit(node.left)
+        # The left operand stays on the stack as the value when it is false
+        jump_end = self.emit(JUMP_IF_FALSE_OR_POP)
+        self.visit(node.right)
+        self.patch(jump_end, self.label())
+
+    def visit_OrBexp(self, node):
+        self.visit(node.left)
+        jump_end = self.emit(JUMP_IF_TRUE_OR_POP)
+        self.visit(node.right)
+        self.patch(jump_end, self.label())
+
+    def visit_XorBexp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(XOR)
+
+    def visit_NotBexp(self, node):
+        self.visit(node.exp)
+        self.emit(NOT)
+
+    def visit_NegateStmt(self, node):
+        self.visit(node.tar)
+        self.emit(NEG)
+
+    def visit_AssigenmentStmt(self, node):
+        self.visit(node.aexp)
+        if isinstance(node.name, SubscriptExp):
+            obj, idx = node.name.get_target()
+            for i in idx:
+                self.visit(i)
+            self.load(obj)
+            self.emit(STORE_SUBSCR, len(idx))
+        else:
+            self.emit(STORE_GLOBAL if self.is_global(node.name) else STORE_NAME, node.name)
+
+    def visit_GlobalStmt(self, node):
+        self.emit(DECLARE_GLOBAL, node.name)
+
+    def visit_Block(self, node):
+        self.visit(node.stmts[0])
+        for s in node.stmts[1:]:
+            self.visit(s)
+            self.emit(COMBINE)
+
+    def visit_IfStmt(self, node):
+        self.visit(node.cond)
+        jump_else = self.emit(POP_JUMP_IF_FALSE)
+        self.visit(node.true_body)
+        jump_end = self.emit(JUMP)
+        self.patch(jump_else, self.label())
+        if node.false_body:
+            self.visit(node.false_body)
+        else:
+            self.emit(LOAD_CONST, None)
+        self.patch(jump_end, self.label())
+
+    def loop(self, cond, body, post=None):
+        'Shared by while and for loops, see `WhileStmt.eval` for the value of a loop'
+        start = self.label()
+        jump_exit = None
+        if cond is not None:
+            self.visit(cond)
+            jump_exit = self.emit(POP_JUMP_IF_FALSE)
+        self.visit(body)
+        loop_body = self.emit(LOOP_BODY)
+        if post:
+            self.visit(post)
+            self.emit(POP)
+        self.emit(JUMP, start)
+        if jump_exit is not None:
+            self.patch(jump_exit, self.label())
+        self.emit(LOAD_CONST, None)
+        self.patch(loop_body, self.label())
+
+    def visit_WhileStmt(self, node):
+        self.loop(node.cond, node.body)
+
+    def visit_ForStmt(self, node):
+        if node.init:
+            self.visit(node.init)
+            self.emit(POP)
+        self.loop(node.cond, node.body, node.post)
+
+    def visit_BreakStmt(self, node):
+        self.emit(LOAD_CONST, BREAK)
+
+    def visit_ReturnExpression(self, node):
+        self.visit(node.exp)
+
+    def function(self, node, name):
+        scope = node.scope or resolve_function(node)
+        code = Compiler(name, node.param, toplevel=False,
+                        declared_global=scope.declared_global).compile_body(node.body)
+        code.impurity = scope.impurity
+        return code
+
+    def visit_FuncDeclareStmt(self, node):
+        self.emit(MAKE_FUNCTION, self.function(node, node.name))
+
+    def visit_LambdaDeclareStmt(self, node):
+        self.emit(MAKE_LAMBDA, self.function(node, str(id(node))))
+
+    def visit_ArrayInitStmt(self, node):
+        self.visit(node.size)
+        if node.init_value:
+            self.visit(node.init_value)
+        else:
+            self.emit(LOAD_CONST, None)
+        self.emit(MAKE_ARRAY)
+
+    def visit_FuncCallStmt(self, node):
+        groups = [[] if p is None else p for p in node.param_list] or [[]]
+        if isinstance(node.func_name, LambdaDeclareStmt):
+            self.visit(node.func_name)
+        elif node.calls_builtin():
+            # built-in functions are called by name
+            self.emit(LOAD_CONST, node.func_name)
+        elif node.func_name in self.declared_global:
+            self.emit(LOAD_GLOBAL_CALLEE, node.func_name)
+        else:
+            self.emit(LOAD_CALLEE, node.func_name)
+        for n, group in enumerate(groups):
+            for p in group:
+                self.visit(p)
+            # Following calls in a chain(f()()) run in the context the returned function is bound to
+            if node.tail and n == len(groups) - 1:
+                self.emit(TAIL_CALL, (len(group), n > 0, node.tail == TAIL_COMBINED))
+            else:
+                self.emit(CALL, (len(group), n > 0))
+
+
+def compile_program(tree):
+    'Compile the AST returned by `ty_parse` into the code object of the program'
+    return Compiler('<program>').compile_body(tree)
+
+
+def disassemble(code, indent=''):
+    lines = ['{}{}{}:'.format(indent, code.name, code.param)]
+    nested = []
+    for i, (op, arg) in enumerate(code.instrs):
+        if isinstance(arg, Code):
+            nested.append(arg)
+            arg = arg.name if op == MAKE_FUNCTION else '<lambda>'
+        elif callable(arg) and not isinstance(arg, str):
+            arg = arg.__name__
+        lines.append('{}{:>6} {:<18} {}'.format(indent, i, opnames[op], '' if arg is None else arg))
+    for c in nested:
+        lines.append(disassemble(c, indent + '    '))
+    return '\n'.join(lines)
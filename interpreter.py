@@ -0,0 +1,160 @@
+'''
+Embedding of Tiny in Python programs.
+An `Interpreter` compiles a source once into a `Program`, which can then be run any number of times,
+each run with its own input, output and global environment:
+    interpreter = Interpreter(engine='vm')
+    program = interpreter.compile(source)
+    text = program.output(stdin='10\n')
+    value = program.run(stdin=open('input.txt', 'rb'), stdout=sys.stdout, env={})
+Errors raise exceptions: `ParseError` when the source cannot be parsed, the exception of the
+error otherwise(e.g. a variable that is not declared, a division by zero).
+Sources may be compiled by several threads at once. Runs are not: the input and output of the builtins
+are shared by the whole process, and the `tree` and `python` engines raise the recursion limit of the
+process(`sys.setrecursionlimit`) during each run and restore it afterwards(see `runtime.run_deep`).
+The runs started by several threads are made one at a time, in the order they take `run_lock`
+'''
+import io
+import threading
+
+# The tree walker module first, the builtin modules are imported while it is initialized
+import ast
+import ast_cache
+import buffered_input
+import buffered_output
+import lexer
+import optimizer
+from runtime import run_deep
+from tiny_parser import ty_parse
+
+engines = ['tree', 'vm', 'python']
+
+# Held during each run, see the module docstring
+run_lock = threading.Lock()
+
+
+class ParseError(Exception):
+    pass
+
+
+def check_engine(engine):
+    if engine not in engines:
+        raise ValueError('Unknown engine {}, expected one of {}'.format(engine, ', '.join(engines)))
+
+
+def input_stream(stdin):
+    'Binary stream of the input `stdin`: a string, bytes, or a binary or text file'
+    if isinstance(stdin, str):
+        return io.BytesIO(stdin.encode())
+    if isinstance(stdin, (bytes, bytearray)):
+        return io.BytesIO(stdin)
+    if hasattr(stdin, 'buffer'):
+        return stdin.buffer
+    if isinstance(stdin, io.TextIOBase):
+        return io.BytesIO(stdin.read().encode())
+    return stdin
+
+
+class Program:
+    '''
+    Tree returned by `ty_parse`, compiled once for `engine`. The tree is not copied:
+    it must not be changed or run by other means while the program is used
+    '''
+
+    def __init__(self, tree, engine='tree'):
+        check_engine(engine)
+        self.tree = tree
+        self.engine = engine
+        self.code = None
+        if engine == 'vm':
+            import vm
+            self.code = vm.compile_program(tree)
+        elif engine == 'python':
+            import transpiler
+            self.code, _ = transpiler.compile_tree(tree)
+
+    def __repr__(self):
+        return 'Program for the {} engine'.format(self.engine)
+
+    def execute(self, env):
+        if self.engine == 'vm':
+            import vm
+            return vm.run(self.code, env)
+        if self.engine == 'python':
+            import transpiler
+            return run_deep(transpiler.run_code, self.code, env)
+        return run_deep(self.tree.eval, env)
+
+    def run(self, stdin=None, stdout=None, env=None):
+        '''
+        Run the program in the global environment `env`, a new one by default, and return its value.
+        `stdin` is the input of the input builtins(see `input_stream`), the input of the process by default.
+        What the program prints is written into the text stream `stdout`, sys.stdout by default,
+        including what was printed before an error. A run started while another thread runs a program
+        waits for it to end
+        '''
+        env = {} if env is None else env
+        with run_lock:
+            # Output pending from a previous run goes where it was meant to
+            buffered_output.flush()
+            saved = buffered_input.stdin, buffered_output.stream
+            if stdin is not None:
+                buffered_input.stdin = buffered_input.BufferedInput(input_stream(stdin))
+            buffered_output.stream = stdout
+            try:
+                return self.execute(env)
+            finally:
+                try:
+                    buffered_output.flush()
+                finally:
+                    buffered_input.stdin, buffered_output.stream = saved
+
+    def output(self, stdin='', env=None):
+        'Run the program with the input `stdin`, nothing by default, and return what it prints'
+        stdout = io.StringIO()
+        self.run(stdin, stdout, env)
+        return stdout.getvalue()
+
+
+class Interpreter:
+    '''
+    Compiler of programs for `engine`, `optimize` tells whether the trees are optimized(see `optimizer.py`)
+    '''
+
+    def __init__(self, engine='tree', optimize=True):
+        check_engine(engine)
+        self.engine = engine
+        self.optimize = optimize
+
+    def __repr__(self):
+        return 'Interpreter for the {} engine'.format(self.engine)
+
+    def program(self, tree):
+        if self.optimize:
+            tree = optimizer.optimize(tree)
+        return Program(tree, self.engine)
+
+    def compile(self, source):
+        'Program of the source string `source`'
+        try:
+            result = ty_parse(lexer.tokenize(source))
+        except Exception as e:
+            raise ParseError(str(e)) from e
+        if not result:
+            raise ParseError('Parsing Error! Please check the syntax')
+        return self.program(result.value)
+
+    def compile_file(self, filename, use_cache=True, cache_dir=None):
+        'Program of the source file `filename`, parsed through the cache of `ast_cache`'
+        try:
+            tree = ast_cache.parse_file(filename, use_cache, cache_dir)
+        except OSError:
+            raise
+        except Exception as e:
+            raise ParseError('{}: {}'.format(filename, e)) from e
+        if tree is None:
+            raise ParseError('{}: Parsing Error! Please check the syntax'.format(filename))
+        return self.program(tree)
+
+    def run(self, source, stdin=None, stdout=None, env=None):
+        'Compile and run the source string `source` once, see `Program.run`'
+        return self.compile(source).run(stdin, stdout, env)
@@ -1,5 +1,6 @@
+import mmap
+import os
 import re
-import sys
 import ty_token
 # BEGIN deprecated lexer function
 token_rule = [
@@ -54,6 +55,7 @@ def make_token(input_code):
     cur = 0
     tokens = []
     cnt = 0
+    line, line_start = 1, 0
     while cur < len(input_code):
         match = None
         for i in token_rule:
@@ -62,12 +64,14 @@ def make_token(input_code):
             if match:
                 data = match.group(0)
                 if tag:
-                    tokens.append((data, tag, cnt))
+                    tokens.append((data, tag, cnt, line, cur - line_start))
                     cnt += 1
+                if '\n' in data:
+                    line += data.count('\n')
+                    line_start = cur + data.rfind('\n') + 1
                 break
         if not match:
-            sys.stderr.write('Illegal character @ {}'.format(cur))
-            sys.exit(-1)
+            raise Exception('Illegal character @ {}'.format(cur))
         else:
             cur = match.end(0)
     return tokens
@@ -150,6 +154,7 @@ class Reader:
         return self.data[p_cur] if p_cur in self.rng else None
 
 
+# BEGIN deprecated lexer function, superseded by `tokenize`
 def advanced_parse(input_code):
     '''
     Tokenizer
@@ -176,7 +181,7 @@ def advanced_parse(input_code):
 
     def add_token(data, tag):
         if not comment_flag:
-            token_list.append((data, tag, cnt.next()))
+            token_list.append((data, tag, cnt.next(), token_line, token_column))
 
     def read_number():
         ans = ''
@@ -212,6 +217,8 @@ def advanced_parse(input_code):
     comment_flag = 0
 
     while reader.has_next():
+        # Position of the token starting with `cur`
+        token_line, token_column = reader.line_number, reader.line_pos
         cur = reader.next()
         if cur == '\n':
             if token_list and token_list[-1][0] in ('func', '=>', '{', '(', 'do', 'then', 'else', '\n'):
@@ -263,3 +270,215 @@ def advanced_parse(input_code):
     # for i in token_list:
     #     print(i)
     return token_list
+# END deprecated lexer function
+
+# Reserved words made of one symbol that never join the symbols following them
+single_symbols = ('(', ')', '~', ';', '-', '[', ']', ',', '{', '}')
+# Newlines following these tokens are not significant
+newline_suppressors = frozenset(('func', '=>', '{', '(', 'do', 'then', 'else', '\n'))
+keywords = frozenset(kw_list)
+
+'Kinds of the lexemes found by `master_pattern`, given by their first character'
+WORD, NUMBER, SINGLE, SYMBOL, QUOTE, NEWLINE, IGNORED = range(7)
+
+# Blanks before a lexeme are captured by the same match, `.` catches the characters that are ignored
+master_pattern = re.compile(r'''
+    ([ \r\t\a\f]*)
+    (   \n
+      | [^\W\d]\w*
+      | \d+(?:[.e][\d-]*)?
+      | [()~;\-\[\],{}]
+      | [+*/%^|&><=!:][+*/%^|&><={}]*
+      | '[^']*'? | "[^"]*"?
+      | .
+    )
+''', re.VERBOSE)
+
+
+def char_kind(c):
+    'Kind of the lexeme starting with `c`, following the classes used by `master_pattern`'
+    if c == '\n':
+        return NEWLINE
+    if c.isdecimal():
+        return NUMBER
+    if c.isalnum() or c == '_':
+        return WORD
+    if c in single_symbols:
+        return SINGLE
+    if c in '+*/%^|&><=!:':
+        return SYMBOL
+    if c in '\'"':
+        return QUOTE
+    return IGNORED
+
+
+char_kinds = {chr(i): char_kind(chr(i)) for i in range(128)}
+
+
+def number_error(data, line, column):
+    'Raise the error of the invalid number `data` found at `column` of `line`'
+    second = data.find('-', data.find('-') + 1)
+    if data.find('-') != -1 and second != -1:
+        column += second
+    else:
+        column += len(data)
+    raise Exception('Invalid float @ line {}, {}'.format(line, column))
+
+
+def scan(pieces):
+    '''
+    Generator of the tokens of a source given as consecutive pieces of text, every
+    piece but the last one ending with a newline. Only the piece being scanned is
+    held in memory: a string left open at the end of a piece is carried to the next one.
+    Newlines after the tokens in `newline_suppressors` and before `end`/`else` are
+    dropped, as well as the leading and trailing ones, and `<* *>` comments nest.
+    Digits are the decimal digits of Unicode.
+    Tokens are (data, tag, index, line, column), the line of the first character of the
+    token counting from 1 and its column from 0
+    '''
+    kinds = char_kinds
+    cnt = 0
+    comment_flag = 0
+    last = None  # the last token produced, including the held ones
+    held = []  # tokens whose data is a newline, held back until the following token is known
+    started = False
+    carry = ''
+    line, column = 1, 0
+    pieces = iter(pieces)
+    piece = next(pieces, None)
+    while piece is not None:
+        following = next(pieces, None)
+        text = carry + piece if carry else piece
+        lexemes = master_pattern.findall(text)
+        carry = ''
+        if following is not None and lexemes:
+            data = lexemes[-1][1]
+            if data[0] in '\'"' and (len(data) == 1 or data[-1] != data[0]):
+                # The string goes on in the next piece
+                carry = text[len(text) - len(data):]
+                lexemes.pop()
+        # Offsets in `text` of the end of the last lexeme and of the start of its line
+        end = 0
+        line_start = -column
+        for blanks, data in lexemes:
+            start = end + len(blanks)
+            end = start + len(data)
+            token_line, token_column = line, start - line_start
+            c = data[0]
+            kind = kinds.get(c)
+            if kind is None:
+                kind = kinds[c] = char_kind(c)
+            if kind == WORD:
+                if data in keywords:
+                    tag = ty_token.BOOL if data == 'True' or data == 'False' else ty_token.RESERVED
+                else:
+                    tag = ty_token.IDENTIFIER
+            elif kind == SINGLE:
+                tag = ty_token.RESERVED
+            elif kind == NEWLINE:
+                # Lines are counted inside comments and after the newlines that are dropped as well
+                line += 1
+                line_start = end
+                if comment_flag or (last is not None and last[0] in newline_suppressors):
+                    continue
+                last = ('\n', ty_token.RESERVED, cnt, token_line, token_column)
+                held.append(last)
+                cnt += 1
+                continue
+            elif kind == SYMBOL:
+                if data == '<*':
+                    comment_flag += 1
+                    continue
+                if data == '*>':
+                    comment_flag -= 1
+                    continue
+                tag = ty_token.RESERVED
+            elif kind == NUMBER:
+                if data.isdigit():
+                    tag = ty_token.INT
+                else:
+                    if not data[-1].isdigit() or data.count('-') > 1:
+                        number_error(data, token_line, token_column)
+                    tag = ty_token.DOUBLE
+            elif kind == QUOTE:
+                if '\n' in data:
+                    line += data.count('\n')
+                    line_start = start + data.rfind('\n') + 1
+                data = data[1:-1] if len(data) > 1 and data[-1] == c else data[1:]
+                tag = ty_token.STRING
+            else:
+                continue
+            if comment_flag:
+                continue
+            last = (data, tag, cnt, token_line, token_column)
+            cnt += 1
+            if data == '\n':
+                held.append(last)
+                continue
+            if held:
+                if data == 'end' or data == 'else':
+                    held.pop()
+                if started:
+                    yield from held
+                held.clear()
+            started = True
+            yield last
+        # Every piece but the last one ends with a newline, unless a string is carried
+        column = len(text) - len(carry) - line_start
+        piece = following
+
+
+def tokenize(input_code):
+    '''
+    Tokenizer scanning the source with one precompiled regular expression.
+    It returns the same token list as `advanced_parse`
+    :param input_code: string
+    :return: token list
+    '''
+    if not input_code:
+        return []
+    if input_code[-1] == '\n':
+        input_code = input_code[:-1]
+    return list(scan((input_code,)))
+
+
+def iter_tokens(input_code):
+    'Same as `tokenize`, yielding the tokens one by one'
+    if input_code and input_code[-1] == '\n':
+        input_code = input_code[:-1]
+    return scan((input_code,))
+
+
+def read_pieces(data, piece_size=1 << 20):
+    '''
+    Split the bytes-like `data`(e.g. an mmap) into decoded pieces of about `piece_size` bytes
+    ending at line boundaries. A final newline is left out like `tokenize` does
+    '''
+    end = len(data)
+    if data[end - 2:end] == b'\r\n':
+        end -= 2
+    elif end and data[end - 1:end] in (b'\n', b'\r'):
+        end -= 1
+    start = 0
+    while start < end:
+        cut = data.rfind(b'\n', start, min(start + piece_size, end))
+        if cut == -1:
+            cut = data.find(b'\n', start + piece_size, end)
+            cut = end if cut == -1 else cut + 1
+        else:
+            cut += 1
+        # Same newline translation as files opened in text mode
+        yield data[start:cut].decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        start = cut
+
+
+def iter_file_tokens(filename, piece_size=1 << 20):
+    '''
+    Generator of the tokens of a source file, which is memory-mapped and
+    scanned piece by piece instead of being read as a whole
+    '''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from scan(read_pieces(data, piece_size))
@@ -0,0 +1,122 @@
+'''
+Memoization of pure functions.
+`memoize(f, max_size)` gives the function value `f` a `Memo`: its calls are then looked up by
+argument tuple, and the body only runs for arguments it has not seen, recursive calls included.
+At most `max_size` results are kept, the least recently used one is dropped first.
+Only functions whose value depends on nothing but their arguments are accepted: the resolver
+rejects the bodies that declare `global` names, read variables of their callers, use arrays
+or call builtins with effects or functions that are not local(see `resolver.impurity`).
+Arrays are also rejected as arguments and as results, since they can change after the call,
+and so are the function arguments that cannot be memoized themselves
+'''
+from collections import OrderedDict
+
+# The tree walker module, imported while it is being initialized: its names are only read at call time
+import ast
+
+default_max_size = 1 << 16
+
+# Result of `Memo.get` for arguments that are not cached
+MISSING = object()
+
+# Types of the arguments looked at by `Memo.key`: arrays and function values, set by the first `memoize`
+checked_types = frozenset()
+
+
+class Memo:
+    'Results of a function by argument tuple, `hits` and `misses` count the lookups'
+    __slots__ = ['name', 'max_size', 'results', 'hits', 'misses']
+
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'Memo of {}: {} result(s), {} hit(s), {} miss(es)'.format(
+            self.name, len(self.results), self.hits, self.misses)
+
+    def key(self, args):
+        'Key of the argument tuple, the types are part of it so that 1 and 1.0 are told apart'
+        for a in args:
+            if type(a) in checked_types:
+                if type(a) is ast.Array:
+                    raise Exception('Memoized function {} cannot take arrays'.format(self.name))
+                reason = impurity(a)
+                if reason is not None:
+                    raise Exception('Memoized function {} cannot take {}: it {}'.format(self.name, a.name, reason))
+        return (*args, *map(type, args))
+
+    def get(self, key):
+        value = self.results.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        'Cache the result `value` and return it'
+        if type(value) is ast.Array:
+            raise Exception('Memoized function {} cannot return arrays'.format(self.name))
+        results = self.results
+        results[key] = value
+        if len(results) > self.max_size:
+            results.popitem(last=False)
+        return value
+
+
+def impurity(func):
+    'Why the function value `func` cannot be memoized, None when it is pure'
+    if isinstance(func, ast.Func):
+        return func.scope.impurity
+    # Closures of the compiled engines(see `runtime.Closure`), the compilers copy the reason to the code
+    return func.code.impurity
+
+
+def expect_function(name, value):
+    import runtime
+    if not isinstance(value, (ast.Func, runtime.Closure)):
+        raise Exception('{} expects a function, got {}'.format(name, type(value)))
+
+
+def memo_of(name, func):
+    expect_function(name, func)
+    if func.memo is None:
+        raise Exception('{} is not memoized'.format(func.name))
+    return func.memo
+
+
+def memoize(func, max_size=default_max_size):
+    'Cache the results of `func`, at most `max_size` of them. A new cache replaces the previous one'
+    global checked_types
+    import runtime
+    expect_function('memoize', func)
+    checked_types = frozenset([ast.Array, ast.Func, ast.Lambda, runtime.Closure])
+    if type(max_size) is not int or max_size < 1:
+        raise Exception('memoize expects a positive cache size, got {}'.format(max_size))
+    reason = impurity(func)
+    if reason is not None:
+        raise Exception('Cannot memoize {}: it {}'.format(func.name, reason))
+    func.memo = Memo(func.name, max_size)
+    return func
+
+
+def memo_hits(func):
+    'Number of calls of a memoized function answered from its cache'
+    return memo_of('memo_hits', func).hits
+
+
+def memo_misses(func):
+    'Number of calls of a memoized function that ran its body'
+    return memo_of('memo_misses', func).misses
+
+
+functions = {
+    'memoize': memoize,
+    'memo_hits': memo_hits,
+    'memo_misses': memo_misses,
+}
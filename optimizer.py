@@ -0,0 +1,267 @@
+'''
+Optimizations of the AST returned by `ty_parse`, run before any engine.
+    - constant folding: arithmetic, relational, logical and negation expressions
+      whose operands are literals are replaced by their value. An expression that
+      would fail at run time(e.g. a division by zero) is left for the run time to report.
+      `andalso` and `orelse` are folded as soon as their left operand is a literal
+    - dead branches: an `if` whose condition is a literal is replaced by the branch
+      it takes, a `while` or `for` loop whose condition is a false literal never runs
+      its body and is removed
+Tiny keeps executing the statements that follow `return` or `break`, so they are not dead code.
+A statement list evaluates to its first truthy value, or None. A dead statement evaluates
+to None and is dropped from a list, unless it is the last one left and the list
+value would change(see `settles`). Branches holding a `global` statement are kept,
+since `global` applies to the whole function body
+'''
+from ast import *
+
+constants = (NumAexp, StrAexp, BoolAexp)
+
+
+def constant(value):
+    'Literal node of `value`, None when the value has no literal'
+    if isinstance(value, bool):
+        return BoolAexp(value)
+    if isinstance(value, (int, float)):
+        return NumAexp(value)
+    if isinstance(value, str):
+        return StrAexp(value)
+    return None
+
+
+def describe(node):
+    'Short source-like text of an expression, used by the report'
+    if isinstance(node, StrAexp):
+        return '"{}"'.format(node.v)
+    if isinstance(node, constants):
+        return str(node.v)
+    if isinstance(node, VarAexp):
+        return node.name
+    if isinstance(node, (BinopAexp, RelopBexp)):
+        return '({} {} {})'.format(describe(node.left), node.op, describe(node.right))
+    if isinstance(node, (AndBexp, OrBexp, XorBexp)):
+        op = {AndBexp: 'andalso', OrBexp: 'orelse', XorBexp: 'xor'}[type(node)]
+        return '({} {} {})'.format(describe(node.left), op, describe(node.right))
+    if isinstance(node, NotBexp):
+        return 'not {}'.format(describe(node.exp))
+    if isinstance(node, NegateStmt):
+        return '~{}'.format(describe(node.tar))
+    return repr(node)
+
+
+def sequence(node):
+    'Statements of a `Block` in evaluation order, including the statements of nested blocks'
+    if not isinstance(node, Block):
+        return [node]
+    stmts = []
+    for s in node.stmts:
+        stmts.extend(sequence(s))
+    return stmts
+
+
+def declares_global(node):
+    'Whether a `global` statement of the current function body is found in `node`'
+    for s in sequence(node):
+        if isinstance(s, GlobalStmt):
+            return True
+        if isinstance(s, IfStmt):
+            if declares_global(s.true_body) or (s.false_body and declares_global(s.false_body)):
+                return True
+        elif isinstance(s, WhileStmt):
+            if declares_global(s.body):
+                return True
+        elif isinstance(s, ForStmt):
+            if any(declares_global(n) for n in (s.init, s.body, s.post) if n):
+                return True
+    return False
+
+
+def settles(node):
+    'Whether `node` always evaluates to None or to a truthy value'
+    if isinstance(node, (Block, AssigenmentStmt, GlobalStmt, FuncDeclareStmt, BreakStmt)):
+        return True
+    if isinstance(node, IfStmt):
+        return settles(node.true_body) and (node.false_body is None or settles(node.false_body))
+    return False
+
+
+def is_false(node):
+    return isinstance(node, constants) and not node.v
+
+
+def is_dead(node):
+    'Whether the statement `node` does nothing and evaluates to None'
+    if isinstance(node, IfStmt):
+        return is_false(node.cond) and not node.false_body and not declares_global(node.true_body)
+    if isinstance(node, WhileStmt):
+        return is_false(node.cond) and not declares_global(node.body)
+    if isinstance(node, ForStmt):
+        return node.init is None and is_false(node.cond) and not declares_global(node)
+    return False
+
+
+class Optimizer:
+    '''
+    Rewrite a tree, `optimize` returns the new root. The nodes of the tree are updated in place.
+    `changes` describes every rewrite in the order it was made
+    '''
+
+    def __init__(self):
+        self.changes = []
+
+    def report(self):
+        return '\n'.join(self.changes)
+
+    def optimize(self, node):
+        if isinstance(node, Block):
+            return self.statements(node)
+        if isinstance(node, IfStmt):
+            return self.if_stmt(node)
+        if isinstance(node, WhileStmt):
+            node.cond = self.optimize(node.cond)
+            if is_false(node.cond):
+                return node
+            node.body = self.optimize(node.body)
+        elif isinstance(node, ForStmt):
+            return self.for_stmt(node)
+        elif isinstance(node, (FuncDeclareStmt, LambdaDeclareStmt)):
+            node.body = self.optimize(node.body)
+        elif isinstance(node, AssigenmentStmt):
+            node.aexp = self.optimize(node.aexp)
+            if isinstance(node.name, SubscriptExp):
+                self.optimize(node.name)
+        elif isinstance(node, ReturnExpression):
+            node.exp = self.optimize(node.exp)
+        elif isinstance(node, FuncCallStmt):
+            if isinstance(node.func_name, LambdaDeclareStmt):
+                self.optimize(node.func_name)
+            for group in node.param_list:
+                if group:
+                    group[:] = [self.optimize(p) for p in group]
+        elif isinstance(node, ArrayInitStmt):
+            node.size = self.optimize(node.size)
+            if node.init_value:
+                node.init_value = self.optimize(node.init_value)
+        elif isinstance(node, SubscriptExp):
+            node.idx = [self.optimize(i) for i in node.idx]
+        elif isinstance(node, (BinopAexp, RelopBexp, AndBexp, OrBexp, XorBexp)):
+            node.left = self.optimize(node.left)
+            node.right = self.optimize(node.right)
+            return self.fold(node)
+        elif isinstance(node, NotBexp):
+            node.exp = self.optimize(node.exp)
+            return self.fold(node)
+        elif isinstance(node, NegateStmt):
+            node.tar = self.optimize(node.tar)
+            return self.fold(node)
+        return node
+
+    def fold(self, node):
+        'Replace an expression whose operands are literals by its value'
+        if isinstance(node, NotBexp):
+            if not isinstance(node.exp, constants):
+                return node
+            folded = locate(BoolAexp(not node.exp.v), node)
+        elif isinstance(node, NegateStmt):
+            if not isinstance(node.tar, NumAexp):
+                return node
+            folded = locate(NumAexp(-node.tar.v), node)
+        elif isinstance(node, (AndBexp, OrBexp)) and isinstance(node.left, constants):
+            # The left operand alone decides which operand gives the value
+            if bool(node.left.v) == isinstance(node, AndBexp):
+                folded = node.right
+            else:
+                folded = node.left
+        else:
+            if not isinstance(node.left, constants) or not isinstance(node.right, constants):
+                return node
+            lv, rv = node.left.v, node.right.v
+            try:
+                if isinstance(node, BinopAexp):
+                    # Same type check as `BinopAexp.eval`
+                    type(lv)(rv)
+                    value = node.func(lv, rv)
+                elif isinstance(node, RelopBexp):
+                    value = node.func(lv, rv)
+                else:
+                    value = lv ^ rv
+            except Exception:
+                return node
+            folded = constant(value)
+            if folded is None:
+                return node
+            locate(folded, node)
+        self.changes.append('folded {} into {}'.format(describe(node), describe(folded)))
+        return folded
+
+    def if_stmt(self, node):
+        node.cond = self.optimize(node.cond)
+        if isinstance(node.cond, constants):
+            taken, dropped = (node.true_body, node.false_body) if node.cond.v else (node.false_body, node.true_body)
+            if taken is not None and not (dropped and declares_global(dropped)):
+                self.changes.append('if with constant condition {}: kept the {} branch only'.format(
+                    describe(node.cond), 'then' if node.cond.v else 'else'))
+                return self.optimize(taken)
+            if taken is None:
+                # Dead statement, removed by the enclosing statement list
+                return node
+        node.true_body = self.optimize(node.true_body)
+        if node.false_body:
+            node.false_body = self.optimize(node.false_body)
+        return node
+
+    def for_stmt(self, node):
+        if node.init:
+            node.init = self.optimize(node.init)
+        node.cond = self.optimize(node.cond)
+        if is_false(node.cond):
+            if isinstance(node.init, AssigenmentStmt) and not declares_global(node):
+                self.changes.append('for loop with constant condition {}: kept its initialization only'.format(
+                    describe(node.cond)))
+                return node.init
+            return node
+        node.body = self.optimize(node.body)
+        if node.post:
+            node.post = self.optimize(node.post)
+        return node
+
+    def statements(self, node):
+        'Optimize a statement list and remove its dead statements'
+        stmts = []
+        for s in sequence(node):
+            # Taken branches may be statement lists themselves
+            stmts.extend(sequence(self.optimize(s)))
+        dead = [s for s in stmts if is_dead(s)]
+        kept = [s for s in stmts if not is_dead(s)]
+        if not kept:
+            kept = dead[:1]
+        elif len(kept) == 1 and dead and not settles(kept[0]):
+            # Alone, the statement would give its own value instead of the value of the list
+            kept = [s for s in stmts if s is kept[0] or s is dead[0]]
+        kept_ids = set(map(id, kept))
+        for s in dead:
+            if id(s) not in kept_ids:
+                self.changes.append('removed {}'.format(self.dead_description(s)))
+        if len(kept) == 1:
+            return kept[0]
+        node.stmts = kept
+        return node
+
+    def dead_description(self, node):
+        if isinstance(node, IfStmt):
+            return 'if with constant condition {} and no else branch'.format(describe(node.cond))
+        if isinstance(node, WhileStmt):
+            return 'while loop with constant condition {}'.format(describe(node.cond))
+        return 'for loop with constant condition {}'.format(describe(node.cond))
+
+
+def optimize(tree, changes=None):
+    '''
+    Optimize the AST returned by `ty_parse`, the descriptions of the rewrites
+    are appended to the list `changes` when one is given
+    '''
+    optimizer = Optimizer()
+    tree = optimizer.optimize(tree)
+    if changes is not None:
+        changes.extend(optimizer.changes)
+    return tree
@@ -0,0 +1,312 @@
+'''
+Profiling of a run of `tiny.py --profile`.
+`Phases` measures the wall time of the steps of a run(lexing, parsing, optimizing, running...),
+`FunctionProfiler` the calls of every Tiny function run by the tree walker: number of calls,
+self time(spent in the body itself) and inclusive time(including the functions it calls).
+`report` formats both as tables, `dump` as JSON.
+`LineProfiler`(`tiny.py --line-profile`) counts the runs of the statements of every source line
+and their time, `line_report` prints them beside the source
+'''
+import contextlib
+import json
+import time
+
+import ast
+
+clock = time.perf_counter
+
+# Returned by `next` once an iterator is exhausted
+_end = object()
+
+
+class Phases:
+    '''
+    Seconds spent in each phase, in the order the phases first ran.
+    The time of a phase run inside another one is not counted in the enclosing phase
+    '''
+
+    def __init__(self):
+        self.seconds = {}
+        # Time taken by the phases run inside each of the phases being run
+        self.nested = [0.0]
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.nested[-1] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = clock()
+        self.nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = clock() - start
+            inner = self.nested.pop()
+            self.add(name, elapsed - inner)
+            self.nested[-1] += inner
+
+    def timed(self, name, iterable):
+        'Iterate over `iterable`, the time taken to produce the items(e.g. tokens) counts in the phase `name`'
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            item = next(iterator, _end)
+            self.add(name, clock() - start)
+            if item is _end:
+                return
+            yield item
+
+
+def phase(phases, name):
+    'Context timing the phase `name` when `phases` is given'
+    if phases is None:
+        return contextlib.nullcontext()
+    return phases.phase(name)
+
+
+def function_name(func):
+    if isinstance(func, ast.Lambda):
+        return '<lambda {}>'.format(func.name)
+    return func.name
+
+
+class FunctionProfiler:
+    '''
+    Statistics of the Tiny functions called by the tree walker while the profiler is installed:
+    `ast.Func.eval` and the builtin calls of `ast.FuncCallStmt` then go through it.
+    `stats` maps (name, kind) to [calls, self seconds, inclusive seconds], the kind being
+    'function', 'lambda' or 'builtin'. The inclusive time of recursive calls is counted once,
+    by the outermost call
+    '''
+
+    def __init__(self):
+        self.stats = {}
+        # One [key, start, seconds spent in callees] entry per running call
+        self.stack = []
+        # Number of running calls of each function
+        self.running = {}
+        self.saved = None
+
+    def enter(self, key):
+        self.running[key] = self.running.get(key, 0) + 1
+        self.stack.append([key, clock(), 0.0])
+
+    def leave(self):
+        key, start, callees = self.stack.pop()
+        elapsed = clock() - start
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed - callees
+        self.running[key] -= 1
+        if not self.running[key]:
+            stats[2] += elapsed
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def install(self):
+        profiler = self
+        call_built_in = ast.call_built_in
+
+        def profiled_eval(self, env, param_list=(), call_frame=None):
+            'Same loop as `ast.Func.eval`, every round is one call'
+            func = self
+            normalize = False
+            while True:
+                profiler.enter((function_name(func), 'lambda' if isinstance(func, ast.Lambda) else 'function'))
+                try:
+                    if func.memo is not None:
+                        result = func.memo_eval(env, param_list, call_frame)
+                    else:
+                        result = func.body.eval(env, call_frame=func.context(param_list, call_frame))
+                finally:
+                    profiler.leave()
+                if type(result) is not ast.TailCall:
+                    if normalize and not result:
+                        return None
+                    return result
+                normalize = normalize or result.normalize
+                func, param_list, call_frame = result.func, result.args, result.parent
+
+        def profiled_built_in(func_name, param):
+            profiler.enter((func_name, 'builtin'))
+            try:
+                return call_built_in(func_name, param)
+            finally:
+                profiler.leave()
+
+        self.saved = ast.Func.eval, call_built_in
+        ast.Func.eval = profiled_eval
+        ast.call_built_in = profiled_built_in
+
+    def uninstall(self):
+        if self.saved is not None:
+            ast.Func.eval, ast.call_built_in = self.saved
+            self.saved = None
+
+    def functions(self):
+        'Statistics of the functions as dicts, by decreasing self time'
+        rows = [{'name': name, 'kind': kind, 'calls': calls, 'self_seconds': own, 'inclusive_seconds': inclusive}
+                for (name, kind), (calls, own, inclusive) in self.stats.items()]
+        rows.sort(key=lambda row: row['self_seconds'], reverse=True)
+        return rows
+
+
+# Fields of the nodes holding statement lists
+body_fields = ('body', 'true_body', 'false_body')
+
+
+def child_nodes(node):
+    '''
+    (field, node) pairs of the nodes held by `node`, directly or in lists(e.g. the statements
+    of a `Block`, the arguments of a call)
+    '''
+    names = list(getattr(node, '__dict__', ()))
+    for cls in type(node).__mro__:
+        names.extend(getattr(cls, '__slots__', ()))
+    for name in names:
+        values = [getattr(node, name, None)]
+        while values:
+            value = values.pop()
+            if isinstance(value, list):
+                values.extend(reversed(value))
+            elif isinstance(value, ast.Node):
+                yield name, value
+
+
+def statements(tree):
+    '''
+    Statements of `tree`: the elements of the program and of the bodies of the functions, lambdas,
+    branches and loops. A statement nested in a statement of the same line(e.g. `if x then y := 1 end`)
+    is left out, so that the runs of the line are counted once
+    '''
+    found = []
+    ids = set()
+    # (node, whether it is a statement list, line of the enclosing statement)
+    pending = [(tree, True, None)]
+    while pending:
+        node, is_body, line = pending.pop()
+        if is_body:
+            for stmt in node.stmts if isinstance(node, ast.Block) else [node]:
+                if stmt.line is not None and stmt.line != line:
+                    found.append(stmt)
+                    ids.add(id(stmt))
+        if id(node) in ids:
+            line = node.line
+        if isinstance(node, (ast.FuncDeclareStmt, ast.LambdaDeclareStmt)):
+            # The body runs apart from the declaration
+            line = None
+        for name, child in child_nodes(node):
+            pending.append((child, name in body_fields, line))
+    return found
+
+
+class LineProfiler:
+    '''
+    Number of runs(hits) and time of the statements of each line of `tree`, while the profiler is
+    installed: the `eval` of the classes of these statements then goes through it, the runs without
+    the profiler are left as they are. `stats` maps a line to [hits, seconds]. The time of a statement
+    does not include the time of the statements of other lines it runs(the body of a loop,
+    the functions it calls), e.g. the time of a `while` line is the time of its condition
+    '''
+
+    def __init__(self, tree):
+        stmts = statements(tree)
+        self.lines = {id(stmt): stmt.line for stmt in stmts}
+        self.stats = {stmt.line: [0, 0.0] for stmt in stmts}
+        self.classes = {type(stmt) for stmt in stmts}
+        # One [line, start, seconds spent in nested statements] entry per running statement
+        self.stack = []
+        self.saved = {}
+
+    def probe(self, original):
+        'Profiled `eval` of a statement class, `original` being its own'
+        lines = self.lines
+        stats = self.stats
+        stack = self.stack
+
+        def profiled_eval(self, env, call_frame=None):
+            line = lines.get(id(self))
+            if line is None:
+                return original(self, env, call_frame)
+            stack.append([line, clock(), 0.0])
+            try:
+                return original(self, env, call_frame)
+            finally:
+                line, start, nested = stack.pop()
+                elapsed = clock() - start
+                counts = stats[line]
+                counts[0] += 1
+                counts[1] += elapsed - nested
+                if stack:
+                    stack[-1][2] += elapsed
+
+        return profiled_eval
+
+    def install(self):
+        originals = {cls: cls.eval for cls in self.classes}
+        for cls, original in originals.items():
+            self.saved[cls] = cls.__dict__.get('eval')
+            cls.eval = self.probe(original)
+
+    def uninstall(self):
+        for cls, eval in self.saved.items():
+            if eval is None:
+                del cls.eval
+            else:
+                cls.eval = eval
+        self.saved = {}
+
+    def rows(self):
+        'Statistics of the lines as dicts, in the order of the lines'
+        return [{'line': line, 'hits': hits, 'seconds': seconds}
+                for line, (hits, seconds) in sorted(self.stats.items())]
+
+
+def line_report(source, rows, width=20):
+    '''
+    The source with the hits and the time of each line given by `LineProfiler.rows`, and
+    a bar of `width` characters at most showing the time of the line against the slowest one
+    '''
+    stats = {row['line']: row for row in rows}
+    slowest = max([row['seconds'] for row in rows], default=0.0) or 1.0
+    lines = ['{:>6} {:>10} {:>12} {:<{}} {}'.format('line', 'hits', 'seconds', 'heat', width, 'source')]
+    for number, text in enumerate(source.splitlines(), 1):
+        row = stats.get(number)
+        if row is None:
+            lines.append('{:>6} {:>10} {:>12} {:<{}} {}'.format(number, '', '', '', width, text))
+        else:
+            bar = '#' * round(width * row['seconds'] / slowest)
+            lines.append('{:>6} {:>10} {:>12.6f} {:<{}} {}'.format(number, row['hits'], row['seconds'],
+                                                                   bar, width, text))
+    return '\n'.join(lines)
+
+
+def report(phases, functions=None):
+    'Text tables of the phases and of the functions, `functions` is given by `FunctionProfiler.functions`'
+    lines = ['{:<24} {:>12}'.format('phase', 'seconds')]
+    for name, seconds in phases.seconds.items():
+        lines.append('{:<24} {:>12.6f}'.format(name, seconds))
+    lines.append('{:<24} {:>12.6f}'.format('total', sum(phases.seconds.values())))
+    if functions is not None:
+        lines.append('')
+        lines.append('{:<24} {:>10} {:>12} {:>12} {:>8}'.format('function', 'calls', 'self', 'inclusive', 'self %'))
+        total = sum(row['self_seconds'] for row in functions) or 1.0
+        for row in functions:
+            name = row['name'] if row['kind'] != 'builtin' else row['name'] + ' (builtin)'
+            lines.append('{:<24} {:>10} {:>12.6f} {:>12.6f} {:>7.1f}%'.format(
+                name, row['calls'], row['self_seconds'], row['inclusive_seconds'], 100 * row['self_seconds'] / total))
+    return '\n'.join(lines)
+
+
+def dump(file, phases, functions=None, engine=None, lines=None):
+    'Write the profile as JSON into the text file `file`, `lines` is given by `LineProfiler.rows`'
+    json.dump({
+        'engine': engine,
+        'phases': [{'name': name, 'seconds': seconds} for name, seconds in phases.seconds.items()],
+        'functions': functions,
+        'lines': lines,
+    }, file, indent=2)
+    file.write('\n')
@@ -1,20 +1,40 @@
+import argparse
+import buffered_output
 import lexer
 from tiny_parser import *
+# After the tree walker module, which imports the builtin modules
+import buffered_input
 import ty_token
 import sys
 
 
 def usage():
-    sys.stderr.write('Usage: tiny filename\n')
+    sys.stderr.write('Usage: repl [--unbuffered]\n')
     sys.exit(1)
 
 
+def read_line(prompt):
+    '''
+    Next line typed, like `input(prompt)`. It is read through the buffer of the input builtins,
+    so that `scan()` gets the lines following the one that calls it
+    '''
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    return buffered_input.decode(buffered_input.reader().line())
+
+
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog='repl', add_help=False)
+    arg_parser.add_argument('--unbuffered', action='store_true')
+    arg_parser.error = lambda message: usage()
+    buffered_output.unbuffered = arg_parser.parse_args().unbuffered
     env = {'_': None}
     last_value = None
+    # Functions declared on the previous lines, which shadow the builtins of the same name
+    declared = set()
     while True:
         try:
-            input_code = input('-> ')
+            input_code = read_line('-> ')
         except EOFError:
             print('Bye~')
             exit(0)
@@ -23,7 +43,7 @@ if __name__ == '__main__':
         if input_code == '_':
             print(last_value)
             continue
-        token_list = lexer.advanced_parse(input_code)
+        token_list = lexer.tokenize(input_code)
         # Process comment blocks
         stk = []
         comment_seg = []
@@ -57,8 +77,8 @@ if __name__ == '__main__':
                     cur = comment_seg.pop()
                     apply_comment.append(cur)
             for i in apply_comment:
-                token_list = list(filter(lambda x: x[-1] not in range(i[0], i[1] + 1), token_list))
-        ast = ty_parse(token_list)
+                token_list = list(filter(lambda x: x[2] not in range(i[0], i[1] + 1), token_list))
+        ast = ty_parse(token_list, declared=declared)
         if ast is None:
             print('SytaxError')
         else:
@@ -66,8 +86,10 @@ if __name__ == '__main__':
                 ast = ast.value
                 last_value = ast.eval(env)
                 env['_'] = last_value
+                buffered_output.flush()
                 if last_value is not None:
                     print(last_value)
             except Exception as e:
+                buffered_output.flush()
                 print(e)
                 pass
@@ -0,0 +1,344 @@
+'''
+Static resolution of the names used by function bodies.
+
+Every function or lambda body gets a `Scope` whose local names(parameters,
+assignments, nested functions and the function itself) are numbered, so the
+tree walker stores them in a flat list(see `ast.Context`) instead of a dict.
+Each name read or written by the body is bound once to one of:
+    - LOCAL: a slot of the current context that is assigned on every path reaching the read
+    - MAYBE_LOCAL: a slot that may still be unbound, in which case the callers are searched
+    - GLOBAL: a name listed in a `global` statement of the body
+    - DYNAMIC: a name that is not local, found by walking the calling contexts
+Tiny is dynamically scoped, so DYNAMIC names cannot be given a fixed depth;
+the walk only visits the live callers and never copies the environment.
+`global` declarations apply to the whole body of the function.
+Every scope also records whether its function can be memoized(see `impurity`).
+'''
+from ast import *
+from built_in_functions import pure_functions
+
+
+def statements(node):
+    'Statements of a `Block`, or the statement itself'
+    if isinstance(node, Block):
+        return node.stmts
+    return [node]
+
+
+def mark_tail_calls(node, combined=False):
+    '''
+    Set `FuncCallStmt.tail` on the calls whose value is the value of the function body `node`.
+    With `combined`, `node` is the last statement of a statement list(TAIL_COMBINED)
+    '''
+    if isinstance(node, ReturnExpression):
+        mark_tail_calls(node.exp, combined)
+    elif isinstance(node, FuncCallStmt):
+        node.tail = TAIL_COMBINED if combined else TAIL
+    elif isinstance(node, IfStmt):
+        mark_tail_calls(node.true_body, combined)
+        if node.false_body:
+            mark_tail_calls(node.false_body, combined)
+    elif isinstance(node, Block) and not combined:
+        mark_tail_calls(node.stmts[-1], True)
+
+
+def call_groups(node):
+    return [[] if p is None else p for p in node.param_list] or [[]]
+
+
+def assigned_locals(node):
+    '''
+    Names local to the calls of a `FuncDeclareStmt` or `LambdaDeclareStmt` that are assigned before
+    they are read, the others may be read from the callers
+    '''
+    scope = node.scope
+    if scope is None:
+        is_lambda = isinstance(node, LambdaDeclareStmt)
+        scope = Scope(None if is_lambda else node.name, node.param, node.body, is_lambda=is_lambda)
+        analyzer = Analyzer(nested=False)
+        analyzer.collect(node.body, scope)
+        analyzer.flow(node.body, scope, set(scope.local) - analyzer.assigned_names(scope))
+    return scope.local - scope.unassigned
+
+
+def impurity(node, bound):
+    '''
+    Why a function whose body holds `node` cannot be memoized, None when its value only depends on
+    its arguments. `bound` holds the names local to the function that are assigned before they are read:
+    reading any other variable(which may be one of the callers), declaring `global` names, using arrays and calling builtins with effects(printing, reading, random numbers)
+    make a function impure. The functions called must be local as well: the nested ones are checked as part
+    of the body, the ones passed as arguments when the memoized function is called(see `memo.Memo.key`)
+    '''
+    if isinstance(node, Block):
+        parts = node.stmts
+    elif isinstance(node, GlobalStmt):
+        return 'declares {} global'.format(node.name)
+    elif isinstance(node, (ArrayInitStmt, SubscriptExp)):
+        return 'uses arrays'
+    elif isinstance(node, VarAexp):
+        return None if node.name in bound else 'reads the variable {} of its callers'.format(node.name)
+    elif isinstance(node, (FuncDeclareStmt, LambdaDeclareStmt)):
+        return impurity(node.body, bound | assigned_locals(node))
+    elif isinstance(node, AssigenmentStmt):
+        parts = [node.aexp, node.name] if isinstance(node.name, SubscriptExp) else [node.aexp]
+    elif isinstance(node, FuncCallStmt):
+        if isinstance(node.func_name, LambdaDeclareStmt):
+            parts = [node.func_name]
+        elif node.calls_builtin():
+            if node.func_name not in pure_functions:
+                return 'calls {}'.format(node.func_name)
+            parts = []
+        elif node.func_name not in bound:
+            # A function of the callers may have effects, or be replaced between two calls
+            return 'calls the function {} of its callers'.format(node.func_name)
+        else:
+            parts = []
+        for group in call_groups(node):
+            parts = parts + group
+    elif isinstance(node, IfStmt):
+        parts = [node.cond, node.true_body, node.false_body]
+    elif isinstance(node, WhileStmt):
+        parts = [node.cond, node.body]
+    elif isinstance(node, ForStmt):
+        parts = [node.init, node.cond, node.body, node.post]
+    elif isinstance(node, (BinopAexp, RelopBexp, AndBexp, OrBexp, XorBexp)):
+        parts = [node.left, node.right]
+    elif isinstance(node, NotBexp):
+        parts = [node.exp]
+    elif isinstance(node, NegateStmt):
+        parts = [node.tar]
+    elif isinstance(node, ReturnExpression):
+        parts = [node.exp]
+    else:
+        return None
+    for part in parts:
+        if part is not None:
+            reason = impurity(part, bound)
+            if reason is not None:
+                return reason
+    return None
+
+
+class Scope:
+    '''
+    Variables of one function or lambda body
+        `local`: names bound in the context of a call(parameters, assignments, nested functions, itself)
+        `slots`: index of every local name in the context, parameters come first
+        `declared_global`: names listed in `global` statements
+        `free`: names read from the callers' contexts
+        `unassigned`: local names that may be read before they are assigned
+        `impurity`: why the function cannot be memoized, None when it can
+    '''
+
+    def __init__(self, name, param, body, is_lambda=False, parent=None, toplevel=False):
+        self.name = name
+        self.param = tuple(param)
+        self.body = body
+        self.is_lambda = is_lambda
+        self.parent = parent
+        self.toplevel = toplevel
+        if len(set(self.param)) != len(self.param):
+            raise Exception('Duplicate parameter in {}{}'.format(name, self.param))
+        self.slots = {}
+        self.local = set()
+        for p in self.param:
+            self.add_local(p)
+        if not is_lambda:
+            self.add_local(name)
+        # Slot holding the function itself, a parameter with the same name takes precedence
+        self.self_slot = None if is_lambda or name in self.param else self.slots[name]
+        self.declared_global = set()
+        self.free = set()
+        self.unassigned = set()
+        self.makes_calls = False
+        self.rebinds_self = name in self.param
+        self.children = []
+        self.needs_frame = False
+        self.py_name = None
+        self.impurity = None
+
+    def add_local(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+            self.local.add(name)
+
+    @property
+    def size(self):
+        return len(self.slots)
+
+
+class Analyzer:
+    '''
+    Collect the `Scope` of the program and of every function declared in it.
+    Name references are bound(see the module docstring) while the bodies are analyzed.
+    With `nested=False` the bodies of the functions declared inside the analyzed
+    body are left alone, they are resolved when they are declared
+    '''
+
+    def __init__(self, nested=True):
+        self.nested = nested
+        self.scopes = []
+        self.declarations = {}
+
+    def analyze(self, tree):
+        top = Scope('<program>', (), tree, is_lambda=True, toplevel=True)
+        self.scopes.append(top)
+        self.collect(tree, top)
+        self.flow(tree, top, set())
+        return top
+
+    def new_scope(self, node, scope):
+        if isinstance(node, FuncDeclareStmt):
+            child = Scope(node.name, node.param, node.body, parent=scope)
+        else:
+            child = Scope(str(id(node)), node.param, node.body, is_lambda=True, parent=scope)
+        if scope is not None:
+            scope.children.append(child)
+            scope.makes_calls = True
+        self.scopes.append(child)
+        self.declarations[id(node)] = child
+        self.collect(child.body, child)
+        self.flow(child.body, child, set(child.local) - self.assigned_names(child))
+        mark_tail_calls(child.body)
+        child.impurity = impurity(child.body, child.local - child.unassigned)
+        node.scope = child
+        return child
+
+    def assigned_names(self, scope):
+        return scope.local - set(scope.param) - ({scope.name} if not scope.is_lambda else set())
+
+    def collect(self, node, scope):
+        'First pass: bindings of the scope'
+        if isinstance(node, Block):
+            for s in node.stmts:
+                self.collect(s, scope)
+        elif isinstance(node, AssigenmentStmt):
+            if isinstance(node.name, str):
+                scope.add_local(node.name)
+                if node.name == scope.name:
+                    scope.rebinds_self = True
+        elif isinstance(node, FuncDeclareStmt):
+            scope.add_local(node.name)
+            if node.name == scope.name:
+                scope.rebinds_self = True
+        elif isinstance(node, GlobalStmt):
+            scope.declared_global.add(node.name)
+        elif isinstance(node, IfStmt):
+            self.collect(node.true_body, scope)
+            if node.false_body:
+                self.collect(node.false_body, scope)
+        elif isinstance(node, WhileStmt):
+            self.collect(node.body, scope)
+        elif isinstance(node, ForStmt):
+            if node.init:
+                self.collect(node.init, scope)
+            self.collect(node.body, scope)
+            if node.post:
+                self.collect(node.post, scope)
+
+    def read(self, name, scope, assigned):
+        'Classify a name read by the scope and return its (kind, slot) binding'
+        if scope.toplevel:
+            return None, None
+        if name in scope.declared_global:
+            return GLOBAL, None
+        if name not in scope.local:
+            scope.free.add(name)
+            return DYNAMIC, None
+        if name not in assigned:
+            scope.unassigned.add(name)
+            return MAYBE_LOCAL, scope.slots[name]
+        return LOCAL, scope.slots[name]
+
+    def write(self, name, scope):
+        if scope.toplevel:
+            return None, None
+        if name in scope.declared_global:
+            return GLOBAL, None
+        return LOCAL, scope.slots[name]
+
+    def flow(self, node, scope, assigned):
+        '''
+        Second pass: classify the names read by the scope.
+        `assigned` is the set of local names definitely bound at this point, it is updated in place
+        '''
+        if isinstance(node, Block):
+            for s in node.stmts:
+                self.flow(s, scope, assigned)
+        elif isinstance(node, AssigenmentStmt):
+            self.flow(node.aexp, scope, assigned)
+            if isinstance(node.name, SubscriptExp):
+                self.flow(node.name, scope, assigned)
+            else:
+                node.kind, node.slot = self.write(node.name, scope)
+                assigned.add(node.name)
+        elif isinstance(node, FuncDeclareStmt):
+            if not scope.toplevel:
+                node.slot = scope.slots[node.name]
+            if self.nested:
+                self.new_scope(node, scope)
+            assigned.add(node.name)
+        elif isinstance(node, LambdaDeclareStmt):
+            if self.nested:
+                self.new_scope(node, scope)
+        elif isinstance(node, IfStmt):
+            self.flow(node.cond, scope, assigned)
+            true_assigned = set(assigned)
+            self.flow(node.true_body, scope, true_assigned)
+            false_assigned = set(assigned)
+            if node.false_body:
+                self.flow(node.false_body, scope, false_assigned)
+            assigned.update(true_assigned & false_assigned)
+        elif isinstance(node, WhileStmt):
+            self.flow(node.cond, scope, assigned)
+            self.flow(node.body, scope, set(assigned))
+        elif isinstance(node, ForStmt):
+            if node.init:
+                self.flow(node.init, scope, assigned)
+            if node.cond:
+                self.flow(node.cond, scope, assigned)
+            in_loop = set(assigned)
+            self.flow(node.body, scope, in_loop)
+            if node.post:
+                self.flow(node.post, scope, in_loop)
+        elif isinstance(node, VarAexp):
+            node.kind, node.slot = self.read(node.name, scope, assigned)
+        elif isinstance(node, SubscriptExp):
+            node.kind, node.slot = self.read(node.obj, scope, assigned)
+            for i in node.idx:
+                self.flow(i, scope, assigned)
+        elif isinstance(node, FuncCallStmt):
+            if isinstance(node.func_name, LambdaDeclareStmt):
+                self.flow(node.func_name, scope, assigned)
+            elif not node.calls_builtin():
+                scope.makes_calls = True
+                node.kind, node.slot = self.read(node.func_name, scope, assigned)
+            groups = call_groups(node)
+            if len(groups) > 1:
+                scope.makes_calls = True
+            for group in groups:
+                for p in group:
+                    self.flow(p, scope, assigned)
+        elif isinstance(node, (BinopAexp, RelopBexp, AndBexp, OrBexp, XorBexp)):
+            self.flow(node.left, scope, assigned)
+            self.flow(node.right, scope, assigned)
+        elif isinstance(node, NotBexp):
+            self.flow(node.exp, scope, assigned)
+        elif isinstance(node, NegateStmt):
+            self.flow(node.tar, scope, assigned)
+        elif isinstance(node, ArrayInitStmt):
+            self.flow(node.size, scope, assigned)
+            if node.init_value:
+                self.flow(node.init_value, scope, assigned)
+        elif isinstance(node, ReturnExpression):
+            self.flow(node.exp, scope, assigned)
+
+
+def resolve_function(node):
+    'Resolve the body of a `FuncDeclareStmt` or `LambdaDeclareStmt`, nested declarations are left for later'
+    return Analyzer(nested=False).new_scope(node, None)
+
+
+def resolve(tree):
+    'Resolve every function declared in the AST returned by `ty_parse`'
+    return Analyzer().analyze(tree)
@@ -0,0 +1,166 @@
+import sys
+import threading
+from ast import BreakStmt
+from memo import MISSING
+
+
+class Frame:
+    '''
+    Activation record of a compiled function call.
+    `vars` holds the locals of the call and `parent` links to the frame
+    the call was made from(None stands for the global environment), which
+    mirrors the `parent` links of `ast.Context`
+    '''
+    __slots__ = ['vars', 'parent']
+
+    def __init__(self, variables, parent):
+        self.vars = variables
+        self.parent = parent
+
+    def __repr__(self):
+        return 'Frame @ {}'.format(hex(id(self)))
+
+
+class Closure:
+    '''
+    Function value produced by the compiled engines.
+    `code` is whatever the engine executes(bytecode or a Python function) and
+    `caller` is the frame the function is bound to, which is used as the parent
+    context of chained calls(closures). `memo` caches the results of the calls
+    once the function is memoized(see `memo.py`)
+    '''
+    __slots__ = ['name', 'param', 'code', 'caller', 'is_lambda', 'memo']
+
+    def __init__(self, name, param, code, caller=None, is_lambda=False):
+        self.name = name
+        self.param = param
+        self.code = code
+        self.caller = caller
+        self.is_lambda = is_lambda
+        self.memo = None
+
+    def __repr__(self):
+        if not self.is_lambda:
+            return 'Function: {}({})'.format(self.name, self.param)
+        if self.caller:
+            return 'LambdaFunction from local {} @ {}'.format(hex(id(self.caller)), hex(id(self)))
+        return 'LambdaFunction @ {}'.format(hex(id(self)))
+
+
+BREAK = BreakStmt()
+
+# Stack of the thread started by `run_deep`, and recursion limit while it runs
+deep_stack_size = 1 << 30
+deep_recursion_limit = 1 << 19
+
+
+def lookup(frame, env, name):
+    'Same lookup rule as `ast.find_variable`, on frames keyed by name'
+    while frame is not None:
+        variables = frame.vars
+        if name in variables:
+            return variables[name]
+        frame = frame.parent
+    return env.get(name, None)
+
+
+def load(frame, env, name):
+    'Read a variable through the callers of `frame`, the global environment when `frame` is None'
+    value = lookup(frame, env, name)
+    if value is None:
+        raise Exception('Variable {} not declared'.format(name))
+    return value
+
+
+def not_callable(name):
+    raise Exception('callable object {} is not declared'.format(name))
+
+
+def invalid_call(name):
+    raise Exception('Invalid func call @ {}'.format(name))
+
+
+def call(func, name, frame, *args):
+    'Call `func` from a function whose frame is `frame`'
+    if type(func) is not Closure:
+        not_callable(name)
+    if len(func.param) != len(args):
+        invalid_call(func.name)
+    func.caller = frame
+    if func.memo is not None:
+        return call_memo(func, frame, *args)
+    return func.code(func, frame, *args)
+
+
+def call_top(func, name, *args):
+    'Call `func` from the top level of the program'
+    if type(func) is not Closure:
+        not_callable(name)
+    if len(func.param) != len(args):
+        invalid_call(func.name)
+    if func.memo is not None:
+        return call_memo(func, None, *args)
+    return func.code(func, None, *args)
+
+
+def call_chained(func, *args):
+    'Call the function returned by a call, in the context it is bound to'
+    if type(func) is not Closure:
+        raise Exception('{} is not callable'.format(func))
+    if len(func.param) != len(args):
+        invalid_call(func.name)
+    if func.memo is not None:
+        return call_memo(func, func.caller, *args)
+    return func.code(func, func.caller, *args)
+
+
+def call_memo(func, frame, *args):
+    'Call of a memoized function(see `memo.py`), the code only runs when the arguments are not cached'
+    memo = func.memo
+    key = memo.key(args)
+    value = memo.get(key)
+    if value is MISSING:
+        value = memo.put(key, func.code(func, frame, *args))
+    return value
+
+
+def check_global(env, name):
+    if name not in env:
+        raise Exception('{} is not declared in global scope'.format(name))
+
+
+def run_deep(func, *args):
+    '''
+    Return func(*args) computed in a thread with a `deep_stack_size` bytes stack, under a recursion limit
+    of `deep_recursion_limit`. The engines that recurse in Python(the tree walker and the Python engine)
+    run there, so that Tiny recursion goes far deeper than the default limit allows.
+    The stack is reserved, pages are only used as the recursion reaches them.
+    The recursion limit is the one of the whole process: it is raised until func returns, for the other
+    threads as well, then restored
+    '''
+    outcome = []
+
+    def target():
+        try:
+            outcome.append((True, func(*args)))
+        except BaseException as e:
+            outcome.append((False, e))
+
+    limit = sys.getrecursionlimit()
+    stack_size = threading.stack_size()
+    sys.setrecursionlimit(max(limit, deep_recursion_limit))
+    try:
+        # The stack size is read when the thread starts
+        threading.stack_size(deep_stack_size)
+        try:
+            thread = threading.Thread(target=target)
+            thread.start()
+        finally:
+            threading.stack_size(stack_size)
+        thread.join()
+    finally:
+        sys.setrecursionlimit(limit)
+    succeeded, value = outcome[0]
+    if not succeeded:
+        raise value
+    return value
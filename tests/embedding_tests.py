@@ -0,0 +1,76 @@
+'''
+Checks of `interpreter`: sources compiled and programs run by several threads at once.
+It is run as a script(pytest and unittest import the standard `ast`, which the tree walker module shadows).
+Usage: python tests/embedding_tests.py
+'''
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interpreter import Interpreter, engines
+
+source = '''
+n := scan_int()
+s := 0
+for(i := 0;i < n;i := i + 1) do
+    s := s + i
+    print(i)
+end
+print(s)
+'''
+
+
+def expected(n):
+    return ''.join('{} \n'.format(i) for i in range(n)) + '{} \n'.format(n * (n - 1) // 2)
+
+
+def in_threads(work, count=4):
+    'Run work(k) in `count` threads, and return the exceptions they raised'
+    errors = []
+
+    def target(k):
+        try:
+            work(k)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(k,)) for k in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def check_concurrent_compiles(engine):
+    def work(k):
+        for r in range(5):
+            text = Interpreter(engine).compile(source).output('{}\n'.format(k + r))
+            assert text == expected(k + r), text
+
+    errors = in_threads(work)
+    assert not errors, errors
+
+
+def check_concurrent_runs(engine):
+    program = Interpreter(engine).compile(source)
+
+    def work(k):
+        for r in range(5):
+            n = 200 + 37 * k + r
+            text = program.output('{}\n'.format(n))
+            assert text == expected(n), 'run of {} printed {} lines'.format(n, text.count('\n'))
+
+    errors = in_threads(work)
+    assert not errors, errors
+
+
+checks = [check_concurrent_compiles, check_concurrent_runs]
+
+if __name__ == '__main__':
+    for engine in engines:
+        for check in checks:
+            check(engine)
+    print('{} checks passed on {} engines'.format(len(checks), len(engines)))
@@ -0,0 +1,108 @@
+'''
+Checks of `memoize`: the functions that are not pure, or call functions that are not, are rejected.
+It is run as a script(pytest and unittest import the standard `ast`, which the tree walker module shadows).
+Usage: python tests/memo_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interpreter import Interpreter, engines
+
+bump = '''
+counter := 0
+func bump() =>
+    global counter
+    counter := counter + 1
+    return counter
+end
+'''
+
+
+def rejected(engine, source):
+    'Error of memoizing `f` in `source`, None when it is memoized'
+    try:
+        Interpreter(engine).compile(source + '\nmemoize(f)\n').output()
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def check_impure_callee(engine):
+    reason = rejected(engine, bump + 'func f(x) => return x + bump() end')
+    assert reason == 'Cannot memoize f: it calls the function bump of its callers', reason
+
+
+def check_printing_callee(engine):
+    source = '''
+func show(x) =>
+    print(x)
+    return x
+end
+func f(x) => return show(x) * 2 end
+'''
+    reason = rejected(engine, source)
+    assert reason == 'Cannot memoize f: it calls the function show of its callers', reason
+
+
+def check_maybe_unassigned(engine):
+    # y is only assigned when x > 5, otherwise it is read from the callers
+    reason = rejected(engine, 'func f(x) =>\n if x > 5 then\n y := 1\n end\n return x + y\nend')
+    assert reason == 'Cannot memoize f: it reads the variable y of its callers', reason
+    source = '''
+func f(x) =>
+    func g() =>
+        if x > 5 then
+            y := 1
+        end
+        return y
+    end
+    return x + g()
+end'''
+    reason = rejected(engine, source)
+    assert reason == 'Cannot memoize f: it reads the variable y of its callers', reason
+
+
+def check_impure_argument(engine):
+    source = bump + '''
+func f(g, x) => return g() + x end
+memoize(f)
+f(bump, 1)
+'''
+    try:
+        Interpreter(engine).compile(source).output()
+    except Exception as e:
+        assert str(e) == 'Memoized function f cannot take bump: it declares counter global', e
+    else:
+        raise AssertionError('f(bump, 1) ran')
+
+
+def check_pure_functions(engine):
+    source = '''
+func Fib(x) =>
+    func add(a, b) => return a + b end
+    if x = 1 orelse x = 2 then
+        return 1
+    else
+        return add(Fib(x - 1), Fib(x - 2))
+    end
+end
+func twice(g, x) => return g(g(x)) end
+memoize(Fib)
+memoize(twice)
+print(Fib(80))
+print(twice({(y) => return y * 3}, 2))
+'''
+    output = Interpreter(engine).compile(source).output()
+    assert output == '23416728348467685 \n18 \n', output
+
+
+checks = [check_impure_callee, check_printing_callee, check_maybe_unassigned, check_impure_argument,
+          check_pure_functions]
+
+if __name__ == '__main__':
+    for engine in engines:
+        for check in checks:
+            check(engine)
+    print('{} checks passed on {} engines'.format(len(checks), len(engines)))
@@ -0,0 +1,48 @@
+'''
+Checks of deep recursion(see `runtime.run_deep`), through builtin calls as well, which nest C frames.
+It is run as a script(pytest and unittest import the standard `ast`, which the tree walker module shadows).
+Usage: python tests/recursion_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interpreter import Interpreter, engines
+
+through_builtin = '''
+func g(n) =>
+    if n = 0 then
+        return 0
+    else
+        return int(g(n - 1)) + 1
+    end
+end
+print(g({}))
+'''
+
+
+def check_through_builtin(engine):
+    text = Interpreter(engine).compile(through_builtin.format(60000)).output()
+    assert text == '60000 \n', text
+
+
+def check_too_deep(engine):
+    # Beyond the recursion limit the run fails, instead of overflowing the stack of the thread
+    if engine == 'vm':
+        return
+    try:
+        Interpreter(engine).compile(through_builtin.format(1 << 20)).output()
+    except RecursionError:
+        pass
+    else:
+        raise AssertionError('g(2^20) returned')
+
+
+checks = [check_through_builtin, check_too_deep]
+
+if __name__ == '__main__':
+    for engine in engines:
+        for check in checks:
+            check(engine)
+    print('{} checks passed on {} engines'.format(len(checks), len(engines)))
@@ -0,0 +1,51 @@
+'''
+Checks of the calls of builtins and of the functions declared with the same names(see `FuncCallStmt.declared`).
+It is run as a script(pytest and unittest import the standard `ast`, which the tree walker module shadows).
+Usage: python tests/shadow_tests.py
+'''
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from interpreter import Interpreter, engines
+
+
+def output(engine, source):
+    return Interpreter(engine).compile(source).output()
+
+
+def check_hello(engine):
+    # Lambdas called where they are written
+    program = Interpreter(engine).compile_file(os.path.join(root, 'hello.ty'), use_cache=False)
+    assert program.output() == '1 \n', program.output()
+
+
+def check_lambda_call(engine):
+    text = output(engine, 'print({(a) => return a + 1}(5))\nfunc max(a, b) => return 0 end\nprint(max(1, 2))')
+    assert text == '6 \n0 \n', text
+
+
+def check_declared_max(engine):
+    source = '''
+func max(a, b) =>
+    if a > b then
+        return a + 100
+    else
+        return b + 100
+    end
+end
+print(max(3, 9), min(3, 9))
+'''
+    text = output(engine, source)
+    assert text == '109 3 \n', text
+
+
+checks = [check_hello, check_lambda_call, check_declared_max]
+
+if __name__ == '__main__':
+    for engine in engines:
+        for check in checks:
+            check(engine)
+    print('{} checks passed on {} engines'.format(len(checks), len(engines)))
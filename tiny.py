@@ -1,25 +1,112 @@
-import lexer
+import argparse
+import ast_cache
+import batch
+import buffered_output
+import optimizer
+import profiler
+from interpreter import engines
 from tiny_parser import *
+from runtime import run_deep
 import sys
 
 
 def usage():
-    sys.stderr.write('Usage: tiny filename\n')
+    sys.stderr.write('Usage: tiny [--engine={}] [--emit-python=file] [--no-cache] [--cache-dir=dir] '
+                     '[--no-optimize] [--optimize-report] [--unbuffered] [--profile] [--profile-json=file] '
+                     '[--line-profile] filename\n'
+                     '       tiny --batch [--engine={}] [--jobs=n] [--output-dir=dir] filename inputs...\n'
+                     .format('|'.join(engines), '|'.join(engines)))
     sys.exit(1)
 
 
+def run(ast, engine, env, emit_python=None, phases=None):
+    'Run the program with `engine`, the compilation and the run are timed in `phases` when it is given'
+    if engine == 'vm':
+        import vm
+        with profiler.phase(phases, 'compile'):
+            code = vm.compile_program(ast)
+        with profiler.phase(phases, 'run'):
+            return vm.run(code, env)
+    if engine == 'python' or emit_python:
+        import transpiler
+        if emit_python:
+            with open(emit_python, 'w') as f:
+                f.write(transpiler.transpile(ast))
+        if engine == 'python':
+            with profiler.phase(phases, 'compile'):
+                code, _ = transpiler.compile_tree(ast)
+            with profiler.phase(phases, 'run'):
+                return run_deep(transpiler.run_code, code, env)
+    with profiler.phase(phases, 'run'):
+        return run_deep(ast.eval, env)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
+    arg_parser = argparse.ArgumentParser(prog='tiny', add_help=False)
+    arg_parser.add_argument('filename')
+    arg_parser.add_argument('inputs', nargs='*')
+    arg_parser.add_argument('--engine', choices=engines, default='tree')
+    arg_parser.add_argument('--emit-python', metavar='file')
+    arg_parser.add_argument('--no-cache', action='store_true')
+    arg_parser.add_argument('--cache-dir', metavar='dir')
+    arg_parser.add_argument('--no-optimize', action='store_true')
+    arg_parser.add_argument('--optimize-report', action='store_true')
+    arg_parser.add_argument('--unbuffered', action='store_true')
+    arg_parser.add_argument('--profile', action='store_true')
+    arg_parser.add_argument('--profile-json', metavar='file')
+    arg_parser.add_argument('--line-profile', action='store_true')
+    arg_parser.add_argument('--batch', action='store_true')
+    arg_parser.add_argument('--jobs', type=int)
+    arg_parser.add_argument('--output-dir', metavar='dir')
+    arg_parser.error = lambda message: usage()
+    args = arg_parser.parse_args()
+    if args.line_profile and args.engine != 'tree':
+        sys.stderr.write('--line-profile runs with the tree engine only\n')
+        sys.exit(1)
+    if args.inputs and not args.batch:
         usage()
-    filename = sys.argv[1]
-    f = open(filename, 'r')
-    input_code = f.read()
-    f.close()
-    token_list = lexer.advanced_parse(input_code)
-    ast = ty_parse(token_list)
+    if args.batch and (args.profile or args.profile_json or args.line_profile):
+        sys.stderr.write('--batch runs are not profiled\n')
+        sys.exit(1)
+    phases = profiler.Phases() if args.profile or args.profile_json else None
+    ast = ast_cache.parse_file(args.filename, not args.no_cache, args.cache_dir, phases)
     if ast is None:
         sys.stderr.write('Parsing Error! Please check the syntax\n')
         sys.exit(-1)
-    ast = ast.value
+    if not args.no_optimize:
+        changes = []
+        with profiler.phase(phases, 'optimize'):
+            ast = optimizer.optimize(ast, changes)
+        if args.optimize_report:
+            sys.stderr.write('{} optimization(s)\n'.format(len(changes)))
+            for change in changes:
+                sys.stderr.write('    {}\n'.format(change))
+    buffered_output.unbuffered = args.unbuffered
+    if args.batch:
+        sys.exit(1 if batch.main(ast, args.engine, args.inputs, args.jobs, args.output_dir) else 0)
     env = {}
-    ast.eval(env)
+    # Functions are profiled by the tree walker only, the other engines get the phase timings
+    functions = profiler.FunctionProfiler() if phases is not None and args.engine == 'tree' else None
+    if functions is not None:
+        functions.install()
+    lines = profiler.LineProfiler(ast) if args.line_profile else None
+    if lines is not None:
+        lines.install()
+    try:
+        run(ast, args.engine, env, args.emit_python, phases)
+    finally:
+        # Output printed before an error comes before its traceback
+        buffered_output.flush()
+        if lines is not None:
+            lines.uninstall()
+            with open(args.filename) as f:
+                sys.stderr.write(profiler.line_report(f.read(), lines.rows()) + '\n')
+        if phases is not None:
+            if functions is not None:
+                functions.uninstall()
+            rows = functions.functions() if functions is not None else None
+            if args.profile:
+                sys.stderr.write(profiler.report(phases, rows) + '\n')
+            if args.profile_json:
+                with open(args.profile_json, 'w') as f:
+                    profiler.dump(f, phases, rows, args.engine, lines.rows() if lines is not None else None)
@@ -1,7 +1,8 @@
 from combinators import *
 from ast import *
 from ty_token import *
-from functools import reduce
+from functools import reduce, lru_cache
+import threading
 
 arithmetic_exp_levels = [
     ['%', ],
@@ -17,6 +18,27 @@ bool_exp_levels = [
 ]
 
 
+'Grammar rules, built once and shared by every parse'
+grammar_rules = []
+
+
+def rule(func):
+    '''
+    Cache the parser built by a grammar rule. Parsers keep no state between parses,
+    so the grammar is built once per process however many sources are parsed
+    '''
+    cached = lru_cache(maxsize=None)(func)
+    grammar_rules.append(cached)
+    return cached
+
+
+def rebuild_grammar():
+    'Drop the cached rules, which are built again on the next parse'
+    for cached in grammar_rules:
+        cached.cache_clear()
+
+
+@rule
 def keyword(kw):
     return Reserved(kw, RESERVED)
 
@@ -28,23 +50,81 @@ boolean = (Tag(BOOL) ^ (lambda x: True if x == 'True' else False))
 identifier = Tag(IDENTIFIER)
 
 
-def ty_parse(tokens):
-    return build_parser()(tokens, 0)
+'Results of the rules wrapped by `memo`, shared by the parses of a thread'
+memo_table = MemoTable()
+
+
+def memo(key, parser):
+    return Memo(parser, key, memo_table)
+
+
+class ParseState(threading.local):
+    'Calls and names of the functions declared met by the parse of the current thread, see `shadow_builtins`'
+
+    def __init__(self):
+        self.calls = []
+        self.declared = set()
 
+    def clear(self):
+        self.calls.clear()
+        self.declared.clear()
 
+
+parse_state = ParseState()
+
+
+def shadow_builtins(declared):
+    '''
+    Set `FuncCallStmt.declared` on the calls parsed of the functions named in `declared`,
+    a function declared by the program is called instead of the builtin of the same name
+    '''
+    for call in parse_state.calls:
+        # Lambdas called where they are written(`{() => ...}()`) have no name
+        if isinstance(call.func_name, str) and call.func_name in declared:
+            call.declared = True
+
+
+def ty_parse(tokens, memoize=True, declared=None):
+    '''
+    Parse a token list, `memoize` enables packrat memoization of the expression rules.
+    `tokens` may also be any iterable of tokens(e.g. `lexer.iter_file_tokens`),
+    which is read through a `TokenWindow`.
+    `declared` holds the names of the functions declared before the tokens(e.g. on the previous
+    lines of the REPL), the functions declared by the tokens are added to it.
+    The state of a parse is kept per thread: threads may parse at the same time
+    '''
+    if not isinstance(tokens, list):
+        tokens = TokenWindow(tokens)
+    memo_table.clear()
+    memo_table.enabled = memoize
+    try:
+        result = build_parser()(tokens, 0)
+        if declared is None:
+            declared = set()
+        declared |= parse_state.declared
+        shadow_builtins(declared)
+        return result
+    finally:
+        memo_table.clear()
+        parse_state.clear()
+
+
+@rule
 def build_parser():
-    return Phrase(stmt_list())
+    return Phrase(stmt_list(release=True))
 
 
+@rule
 def assignment_stmt():
     def process(result):
         ((name, _), exp) = result
         return AssigenmentStmt(name, exp)
 
-    return ((subscript_exp() | identifier) + keyword(':=') + (
-            aexp() | negate_stmt() | array_init_stmt() | lambda_decl_expr())) ^ process
+    return Located(((subscript_exp() | identifier) + keyword(':=') + (
+            aexp() | negate_stmt() | array_init_stmt() | lambda_decl_expr())) ^ process)
 
 
+@rule
 def if_stmt():
     'Match if-then-else statment'
 
@@ -56,11 +136,12 @@ def if_stmt():
             false_stmt = None
         return IfStmt(condition, true_stmt, false_stmt)
 
-    return keyword('if') + bexp() + keyword('then') \
-           + Lazy(stmt_list) \
-           + Opt(keyword('else') + Lazy(stmt_list)) + keyword('end') ^ processor
+    return Located(keyword('if') + bexp() + keyword('then')
+                   + Lazy(stmt_list)
+                   + Opt(keyword('else') + Lazy(stmt_list)) + keyword('end') ^ processor)
 
 
+@rule
 def while_stmt():
     'Match while-statement'
 
@@ -68,9 +149,10 @@ def while_stmt():
         ((((_, condition), _), body), _) = parsed
         return WhileStmt(condition, body)
 
-    return keyword('while') + bexp() + keyword('do') + Lazy(stmt_list) + keyword('end') ^ processor
+    return Located(keyword('while') + bexp() + keyword('do') + Lazy(stmt_list) + keyword('end') ^ processor)
 
 
+@rule
 def for_stmt():
     'Match for-statement'
 
@@ -78,12 +160,13 @@ def for_stmt():
         ((((((((((_, _), init), _), cond), _), post_act), _), _,), body), _) = parsed
         return ForStmt(init, cond, body, post_act)
 
-    return keyword('for') + keyword('(') \
-           + Opt(Lazy(assignment_stmt)) + keyword(';') + Opt(bexp()) + keyword(';') \
-           + Opt(Lazy(assignment_stmt)) \
-           + keyword(')') + keyword('do') + Lazy(stmt_list) + keyword('end') ^ processor
+    return Located(keyword('for') + keyword('(')
+                   + Opt(Lazy(assignment_stmt)) + keyword(';') + Opt(bexp()) + keyword(';')
+                   + Opt(Lazy(assignment_stmt))
+                   + keyword(')') + keyword('do') + Lazy(stmt_list) + keyword('end') ^ processor)
 
 
+@rule
 def negate_stmt():
     'Match negating a number'
 
@@ -91,17 +174,19 @@ def negate_stmt():
         (_, target) = parsed
         return NegateStmt(target)
 
-    return keyword('~') + Lazy(aexp_term) ^ processor
+    return memo('negate', Located(keyword('~') + Lazy(aexp_term) ^ processor))
 
 
+@rule
 def global_stmt():
     def processor(parsed):
         _, name = parsed
         return GlobalStmt(name)
 
-    return (keyword('global') + identifier) ^ processor
+    return Located((keyword('global') + identifier) ^ processor)
 
 
+@rule
 def func_declaration_stmt():
     'Match new function binding'
 
@@ -109,13 +194,14 @@ def func_declaration_stmt():
         (((((((_, name), _), param), _), _), body), _) = parsed
         if param:
             param = list(map(lambda x: x.value, filter(lambda y: y.value != ',', param)))
+        parse_state.declared.add(name)
         return FuncDeclareStmt(name, param, body)
 
-    return keyword('func') + identifier + keyword('(') + Opt(Rep(identifier | keyword(','))) + keyword(')') + keyword(
-        '=>') \
-           + Lazy(stmt_list) + keyword('end') ^ processor
+    return Located(keyword('func') + identifier + keyword('(') + Opt(Rep(identifier | keyword(','))) + keyword(')')
+                   + keyword('=>') + Lazy(stmt_list) + keyword('end') ^ processor)
 
 
+@rule
 def lambda_decl_expr():
     def processor(parsed):
         ((((((_, _), param), _), _), body,), _) = parsed
@@ -123,10 +209,11 @@ def lambda_decl_expr():
             param = list(map(lambda x: x.value, filter(lambda y: y.value != ',', param)))
         return LambdaDeclareStmt(param, body)
 
-    return keyword('{') + keyword('(') + Opt(Rep(identifier | keyword(','))) + keyword(')') + keyword(
-        '=>') + Lazy(stmt_list) + keyword('}') ^ processor
+    return memo('lambda', Located(keyword('{') + keyword('(') + Opt(Rep(identifier | keyword(','))) + keyword(')')
+                                  + keyword('=>') + Lazy(stmt_list) + keyword('}') ^ processor))
 
 
+@rule
 def func_call_stmt():
     'Match function call'
 
@@ -146,14 +233,17 @@ def func_call_stmt():
                     param_list.append(each)
                 else:
                     param_list.append(None)
-        return FuncCallStmt(name, param_list)
+        call = FuncCallStmt(name, param_list)
+        parse_state.calls.append(call)
+        return call
 
-    return (identifier | lambda_decl_expr()) + Rep(keyword('(') + Opt(Rep(Lazy(array_init_stmt) | Lazy(aexp)
-                                                                          | Lazy(negate_stmt) | Lazy(bexp) | Lazy(
+    return Located((identifier | lambda_decl_expr()) + Rep(keyword('(') + Opt(Rep(Lazy(array_init_stmt) | Lazy(aexp)
+                                                                                  | Lazy(negate_stmt) | Lazy(bexp) | Lazy(
         lambda_decl_expr) | keyword(','))) + keyword(
-        ')')) ^ processor
+        ')')) ^ processor)
 
 
+@rule
 def return_expression_stmt():
     'Match returning a result'
 
@@ -161,16 +251,18 @@ def return_expression_stmt():
         (_, exp) = parsed
         return ReturnExpression(exp)
 
-    return keyword('return') + (aexp() | Lazy(lambda_decl_expr)) ^ processor
+    return Located(keyword('return') + (bexp() | aexp() | Lazy(lambda_decl_expr)) ^ processor)
 
 
+@rule
 def break_stmt():
     def processor(parsed):
         return BreakStmt()
 
-    return keyword('break') ^ processor
+    return Located(keyword('break') ^ processor)
 
 
+@rule
 def array_init_stmt():
     'Match initializing an array'
 
@@ -182,10 +274,11 @@ def array_init_stmt():
             init_value = None
         return ArrayInitStmt(size, init_value)
 
-    return keyword('array') + keyword('(') + Lazy(aexp) + Opt(keyword(',') + (Lazy(array_init_stmt) | Lazy(aexp))) \
-           + keyword(')') ^ processor
+    return Located(keyword('array') + keyword('(') + Lazy(aexp)
+                   + Opt(keyword(',') + (Lazy(array_init_stmt) | Lazy(aexp))) + keyword(')') ^ processor)
 
 
+@rule
 def stmt():
     '''
         Note that subscript_exp() should be called before aexp()
@@ -196,10 +289,19 @@ def stmt():
            | global_stmt()
 
 
-def stmt_list():
-    # Take ; as separator to construct CompoundStatements
-    sep = keyword('\n') ^ (lambda x: lambda l, r: CompoundStmt(l, r))
-    return Exp(stmt(), sep)
+def append_stmt(block, stmt):
+    'Statements are collected in one `Block`, which is only created for the second statement'
+    if isinstance(block, Block):
+        block.stmts.append(stmt)
+        return block
+    return locate(Block([block, stmt]), block)
+
+
+@rule
+def stmt_list(release=False):
+    # Take newline as separator to construct Blocks
+    sep = keyword('\n') ^ (lambda x: append_stmt)
+    return Exp(stmt(), sep, release)
 
 
 def process_tuple(parsed):
@@ -217,16 +319,10 @@ def get_parser_from_list(lst):
 def precedence_combinator(value_parser, precedence_level, post_processor):
     'Precedence combinator is designed for process arithmetic and bool calculations'
     'whose result can be affected by the priority of operators'
-
-    def get_op_parser(p_level):
-        return get_parser_from_list(p_level) ^ post_processor
-
-    ret = value_parser * get_op_parser(precedence_level[0])
-    for i in precedence_level[1:]:
-        ret = ret * get_op_parser(i)
-    return ret
+    return Precedence(value_parser, precedence_level, RESERVED, post_processor)
 
 
+@rule
 def subscript_exp():
     'Indexing expression'
 
@@ -238,68 +334,78 @@ def subscript_exp():
             idx_list.append(idx)
         return SubscriptExp(name, idx_list)
 
-    return (identifier + Rep(keyword('[') + Lazy(aexp) + keyword(']'))) ^ processor
+    return Located((identifier + Rep(keyword('[') + Lazy(aexp) + keyword(']'))) ^ processor)
 
 
+@rule
 def aexp():
     # Major Function
-    return precedence_combinator(aexp_term(), arithmetic_exp_levels, process_binop)
+    return memo('aexp', precedence_combinator(aexp_term(), arithmetic_exp_levels, process_binop))
 
 
+@rule
 def aexp_term():
     'Full set of arithmetic operation'
     return aexp_tuple() | aexp_value()
 
 
+@rule
 def aexp_tuple():
     return ((keyword('(') + Lazy(aexp) + keyword(')')) ^ process_tuple) | func_call_stmt()
 
 
+@rule
 def aexp_value():
     'Note: subscript_exp should be called before identifier'
-    return (num ^ (lambda x: NumAexp(x))) | \
+    return Located(num ^ (lambda x: NumAexp(x))) | \
            negate_stmt() | \
            subscript_exp() | \
-           (identifier ^ (lambda x: VarAexp(x))) | \
-           (string ^ (lambda x: StrAexp(x))) | \
-           (boolean ^ (lambda x: BoolAexp(x)))
+           Located(identifier ^ (lambda x: VarAexp(x))) | \
+           Located(string ^ (lambda x: StrAexp(x))) | \
+           Located(boolean ^ (lambda x: BoolAexp(x)))
 
 
+@rule
 def bexp():
     # Major function
-    return precedence_combinator(bexp_term(), bool_exp_levels, process_logic_exp)
+    return memo('bexp', precedence_combinator(bexp_term(), bool_exp_levels, process_logic_exp))
 
 
+@rule
 def bexp_term():
-    return bexp_not() | bexp_relation_op() | bexp_tuple() | (boolean ^ (lambda x: BoolAexp(x)))
+    return bexp_not() | bexp_relation_op() | bexp_tuple() | Located(boolean ^ (lambda x: BoolAexp(x)))
 
 
+@rule
 def bexp_not():
-    return keyword('not') + Lazy(bexp_term) ^ (lambda x: NotBexp(x[-1]))
+    return Located(keyword('not') + Lazy(bexp_term) ^ (lambda x: NotBexp(x[-1])))
 
 
+@rule
 def bexp_relation_op():
     rel_op = ['>', '<', '>=', '<=', '=', '!=']
     return (aexp() + get_parser_from_list(rel_op) + aexp()) ^ process_relop
 
 
+@rule
 def bexp_tuple():
     return keyword('(') + Lazy(bexp) + keyword(')') ^ process_tuple
 
 
+# Operations are located at their left operand
 def process_binop(op):
-    return lambda l, r: BinopAexp(op, l, r)
+    return lambda l, r: locate(BinopAexp(op, l, r), l)
 
 
 def process_relop(p):
     ((l, op), r) = p
-    return RelopBexp(op, l, r)
+    return locate(RelopBexp(op, l, r), l)
 
 
 def process_logic_exp(op):
     ret_dict = {
-        'andalso': lambda l, r: AndBexp(l, r),
-        'orelse': lambda l, r: OrBexp(l, r),
+        'andalso': lambda l, r: locate(AndBexp(l, r), l),
+        'orelse': lambda l, r: locate(OrBexp(l, r), l),
     }
     ret = ret_dict.get(op, None)
     if ret:
@@ -0,0 +1,470 @@
+'''
+Translate Tiny programs into Python source and run them through `compile()`.
+
+Tiny functions become Python functions and loops become native `while` loops.
+Tiny looks variables up dynamically through the chain of callers, so a call
+only materializes a `Frame` when some other function may look into it;
+every other local is a plain Python local.
+The only known difference from the tree walker is that arithmetic uses the
+Python operators directly, without the operand type check of `BinopAexp`.
+'''
+import keyword
+import math
+import re
+from ast import *
+from resolver import Analyzer, statements, call_groups
+
+binop_symbols = {
+    '+': '+', '-': '-', '*': '*', '/': '/', '%': '%',
+    '|': '|', '&': '&', '^': '^', 'div': '//', 'shl': '<<', 'shr': '>>',
+}
+
+relop_symbols = {'>': '>', '<': '<', '>=': '>=', '<=': '<=', '=': '==', '!=': '!='}
+
+prelude = '''\
+# Generated from a Tiny program. `_env` is the global environment of the program.
+from runtime import Frame as _Frame, Closure as _Closure, BREAK as _BREAK
+from runtime import lookup as _lookup, load as _load, call as _call, call_top as _call_top, call_chained as _call_chained
+from runtime import invalid_call as _invalid_call, call_memo as _call_memo
+from runtime import check_global as _check_global
+from ast import Array as _Array, BreakStmt as _BreakStmt
+from ast import subscript as _subscript, store_subscript as _store_subscript
+from built_in_functions import call_built_in as _call_built_in
+'''
+
+
+def is_builtin_call(node):
+    return isinstance(node, FuncCallStmt) and node.calls_builtin()
+
+
+def is_none_valued(node):
+    'Whether the statement always evaluates to None'
+    if isinstance(node, (AssigenmentStmt, GlobalStmt, FuncDeclareStmt)):
+        return True
+    if isinstance(node, Block):
+        return all(is_none_valued(s) for s in node.stmts)
+    if isinstance(node, IfStmt):
+        return is_none_valued(node.true_body) and (not node.false_body or is_none_valued(node.false_body))
+    return is_builtin_call(node) and node.func_name == 'print'
+
+
+class Discard:
+    'The value of the statement is not used'
+    normalize = False
+
+
+class Assign:
+    'Store the value of the statement into `var`'
+
+    def __init__(self, var, normalize=False):
+        self.var = var
+        self.normalize = normalize
+
+
+class Return:
+    'Return the value of the statement from the generated function'
+
+    def __init__(self, normalize=False):
+        self.normalize = normalize
+
+
+class LoopTail:
+    'Statement ending a loop body: leave the loop when its value is not None'
+
+    def __init__(self, var, normalize=False):
+        self.var = var
+        self.normalize = normalize
+
+
+def with_normalize(ctx):
+    if isinstance(ctx, Assign):
+        return Assign(ctx.var, True)
+    if isinstance(ctx, Return):
+        return Return(True)
+    if isinstance(ctx, LoopTail):
+        return LoopTail(ctx.var, True)
+    return ctx
+
+
+class Generator:
+    '''
+    Emit the Python source of a program.
+    A statement is generated together with a context telling what to do with its value,
+    the value of a block being the first truthy value of its statements(see `Block.eval`)
+    '''
+
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+        self.counter = 0
+        self.dynamic = set()
+        self.frame_bound = set()
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return '{}{}'.format(prefix, self.counter)
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def generate(self, tree):
+        analyzer = Analyzer()
+        top = analyzer.analyze(tree)
+        self.declarations = analyzer.declarations
+        functions = analyzer.scopes[1:]
+        for scope in functions:
+            self.dynamic.update(scope.free)
+            self.dynamic.update(scope.unassigned)
+        for scope in functions:
+            scope.needs_frame = scope.makes_calls and bool(scope.local & self.dynamic)
+            if scope.needs_frame:
+                self.frame_bound.update(scope.local & self.dynamic)
+            base = 'lambda' if scope.is_lambda else 'f_' + scope.name
+            scope.py_name = self.fresh(base + '_')
+        self.lines = prelude.splitlines()
+        for scope in functions:
+            self.emit('')
+            self.emit('')
+            self.function(scope)
+        self.emit('')
+        self.emit('')
+        self.emit('def _main():')
+        self.indent += 1
+        self.scope = top
+        self.stmt(tree, Return())
+        self.indent -= 1
+        return '\n'.join(self.lines) + '\n'
+
+    # Names
+
+    def storage(self, name):
+        scope = self.scope
+        if scope.toplevel or name in scope.declared_global:
+            return 'global'
+        if name in scope.local:
+            return 'frame' if scope.needs_frame and name in self.dynamic else 'native'
+        return 'free'
+
+    def context(self):
+        if self.scope.toplevel:
+            return 'None'
+        return '_fr' if self.scope.needs_frame else '_parent'
+
+    def local_name(self, name):
+        if keyword.iskeyword(name):
+            return 'v_{}_'.format(name)
+        return 'v_' + name
+
+    def read(self, name):
+        kind = self.storage(name)
+        if kind == 'global':
+            return '_env[{!r}]'.format(name)
+        if kind == 'native':
+            if name in self.scope.unassigned:
+                return '({0} if {0} is not None else _load(_parent, _env, {1!r}))'.format(self.local_name(name), name)
+            return self.local_name(name)
+        if kind == 'frame':
+            if name in self.scope.unassigned:
+                return '_load(_fr, _env, {!r})'.format(name)
+            return '_v[{!r}]'.format(name)
+        if name in self.frame_bound:
+            return '_load({}, _env, {!r})'.format(self.context(), name)
+        return '_env[{!r}]'.format(name)
+
+    def target(self, name):
+        kind = self.storage(name)
+        if kind == 'global':
+            return '_env[{!r}]'.format(name)
+        if kind == 'frame':
+            return '_v[{!r}]'.format(name)
+        return self.local_name(name)
+
+    # Functions
+
+    def function(self, scope):
+        self.scope = scope
+        params = ', '.join(self.local_name(p) for p in scope.param)
+        self.emit('def {}(_fn, _parent{}):'.format(scope.py_name, ', ' + params if params else ''))
+        self.indent += 1
+        bound = [] if scope.is_lambda or scope.name in scope.param else [(scope.name, '_fn')]
+        bound += [(p, self.local_name(p)) for p in scope.param]
+        if scope.needs_frame:
+            in_frame = ', '.join('{!r}: {}'.format(n, v) for n, v in bound if n in self.dynamic)
+            self.emit('_fr = _Frame({{{}}}, _parent)'.format(in_frame))
+            self.emit('_v = _fr.vars')
+        for name in sorted(scope.unassigned):
+            if self.storage(name) == 'native':
+                self.emit('{} = None'.format(self.local_name(name)))
+        header = len(self.lines)
+        self.stmt(scope.body, Return())
+        self_name = self.local_name(scope.name)
+        if not scope.is_lambda and scope.name not in scope.param and self.storage(scope.name) == 'native' and \
+                any(re.search(r'\b{}\b'.format(self_name), line) for line in self.lines[header:]):
+            self.lines.insert(header, '    ' * self.indent + '{} = _fn'.format(self_name))
+        self.indent -= 1
+        # Read by `memo.impurity`
+        self.emit('{}.impurity = {!r}'.format(scope.py_name, scope.impurity))
+
+    def closure(self, node, is_lambda):
+        scope = self.declarations[id(node)]
+        name = str(id(node)) if is_lambda else node.name
+        return '_Closure({!r}, {!r}, {}, {}, {})'.format(
+            name, tuple(node.param), scope.py_name, self.context(), is_lambda)
+
+    # Statements
+
+    def deliver(self, value, ctx):
+        if ctx.normalize:
+            value = '{} or None'.format(value)
+        if isinstance(ctx, Assign):
+            self.emit('{} = {}'.format(ctx.var, value))
+        elif isinstance(ctx, Return):
+            self.emit('return {}'.format(value))
+        elif isinstance(ctx, LoopTail):
+            tmp = self.fresh('_t')
+            self.emit('{} = {}'.format(tmp, value))
+            self.emit('if {} is not None:'.format(tmp))
+            self.indent += 1
+            if ctx.var:
+                self.emit('if not isinstance({}, _BreakStmt):'.format(tmp))
+                self.emit('    {} = {}'.format(ctx.var, tmp))
+            self.emit('break')
+            self.indent -= 1
+        else:
+            self.emit(value)
+
+    def deliver_none(self, ctx):
+        if isinstance(ctx, Assign):
+            self.emit('{} = None'.format(ctx.var))
+        elif isinstance(ctx, Return):
+            self.emit('return None')
+
+    def stmt(self, node, ctx):
+        if isinstance(node, Block):
+            self.block(node.stmts, ctx)
+        elif isinstance(node, AssigenmentStmt):
+            self.assignment(node)
+            self.deliver_none(ctx)
+        elif isinstance(node, GlobalStmt):
+            self.emit('_check_global(_env, {!r})'.format(node.name))
+            self.deliver_none(ctx)
+        elif isinstance(node, FuncDeclareStmt):
+            self.emit('{} = {}'.format(self.target(node.name) if not self.scope.toplevel else '_env[{!r}]'.format(node.name),
+                                       self.closure(node, False)))
+            self.deliver_none(ctx)
+        elif isinstance(node, IfStmt):
+            self.emit('if {}:'.format(self.expr(node.cond)))
+            self.indent += 1
+            self.stmt(node.true_body, ctx)
+            self.indent -= 1
+            if node.false_body:
+                self.emit('else:')
+                self.indent += 1
+                self.stmt(node.false_body, ctx)
+                self.indent -= 1
+            elif isinstance(ctx, (Assign, Return)):
+                self.emit('else:')
+                self.indent += 1
+                self.deliver_none(ctx)
+                self.indent -= 1
+        elif isinstance(node, WhileStmt):
+            self.loop(node.cond, node.body, None, ctx)
+        elif isinstance(node, ForStmt):
+            if node.init:
+                self.stmt(node.init, Discard)
+            self.loop(node.cond, node.body, node.post, ctx)
+        elif isinstance(node, BreakStmt):
+            if isinstance(ctx, LoopTail):
+                self.emit('break')
+            elif ctx is not Discard:
+                self.deliver('_BREAK', ctx)
+        elif isinstance(node, ReturnExpression):
+            self.value(node.exp, ctx)
+        else:
+            self.value(node, ctx)
+
+    def value(self, node, ctx):
+        if ctx is Discard and isinstance(node, (NumAexp, StrAexp, BoolAexp)):
+            return
+        self.deliver(self.expr(node), ctx)
+
+    def block(self, stmts, ctx):
+        if ctx is Discard:
+            for s in stmts:
+                self.stmt(s, Discard)
+            return
+        if all(is_none_valued(s) for s in stmts[:-1]):
+            for s in stmts[:-1]:
+                self.stmt(s, Discard)
+            self.stmt(stmts[-1], with_normalize(ctx))
+            return
+        result = self.fresh('_b')
+        self.emit('{} = None'.format(result))
+        for s in stmts:
+            if is_none_valued(s):
+                self.stmt(s, Discard)
+                continue
+            tmp = self.fresh('_s')
+            self.stmt(s, Assign(tmp))
+            self.emit('if {} is None and {}:'.format(result, tmp))
+            self.emit('    {} = {}'.format(result, tmp))
+        self.deliver(result, ctx)
+
+    def loop(self, cond, body, post, ctx):
+        'See `WhileStmt.eval`: a loop ends with the first value of its body that is not None'
+        result = None if ctx is Discard else self.fresh('_r')
+        if result:
+            self.emit('{} = None'.format(result))
+        self.emit('while {}:'.format(self.expr(cond) if cond else 'True'))
+        self.indent += 1
+        stmts = statements(body)
+        if all(is_none_valued(s) for s in stmts[:-1]):
+            for s in stmts[:-1]:
+                self.stmt(s, Discard)
+            self.stmt(stmts[-1], LoopTail(result, len(stmts) > 1))
+        else:
+            self.stmt(body, LoopTail(result))
+        if post:
+            self.stmt(post, Discard)
+        self.indent -= 1
+        if result:
+            self.deliver(result, ctx)
+        elif isinstance(ctx, (Assign, Return)):
+            self.deliver_none(ctx)
+
+    def assignment(self, node):
+        value = self.expr(node.aexp)
+        if isinstance(node.name, SubscriptExp):
+            obj, idx = node.name.get_target()
+            if len(idx) == 1:
+                self.emit('{}[{}] = {}'.format(self.read(obj), self.expr(idx[0]), value))
+            else:
+                # Keyword arguments keep the evaluation order of the tree walker: value, indexes, array
+                self.emit('_store_subscript(value={}, idx=({},), obj={})'.format(
+                    value, ', '.join(self.expr(i) for i in idx), self.read(obj)))
+        else:
+            self.emit('{} = {}'.format(self.target(node.name), value))
+
+    # Expressions
+
+    def expr(self, node):
+        if isinstance(node, (NumAexp, StrAexp, BoolAexp)):
+            if isinstance(node.v, float) and not math.isfinite(node.v):
+                return 'float({!r})'.format(repr(node.v))
+            return repr(node.v)
+        if isinstance(node, VarAexp):
+            return self.read(node.name)
+        if isinstance(node, SubscriptExp):
+            if len(node.idx) == 1:
+                return '{}[{}]'.format(self.read(node.obj), self.expr(node.idx[0]))
+            return '_subscript({}, ({},))'.format(self.read(node.obj), ', '.join(self.expr(i) for i in node.idx))
+        if isinstance(node, BinopAexp):
+            if node.op not in binop_symbols:
+                raise RuntimeError('Unknown operator: {}'.format(node.op))
+            return '({} {} {})'.format(self.expr(node.left), binop_symbols[node.op], self.expr(node.right))
+        if isinstance(node, RelopBexp):
+            if node.op not in relop_symbols:
+                raise RuntimeError('Unknown operator: {}'.format(node.op))
+            return '({} {} {})'.format(self.expr(node.left), relop_symbols[node.op], self.expr(node.right))
+        if isinstance(node, (AndBexp, OrBexp)):
+            op = 'and' if isinstance(node, AndBexp) else 'or'
+            return '({} {} {})'.format(self.expr(node.left), op, self.expr(node.right))
+        if isinstance(node, XorBexp):
+            return '({} ^ {})'.format(self.expr(node.left), self.expr(node.right))
+        if isinstance(node, NotBexp):
+            return '(not {})'.format(self.expr(node.exp))
+        if isinstance(node, NegateStmt):
+            return '(-{})'.format(self.expr(node.tar))
+        if isinstance(node, ArrayInitStmt):
+            init_value = self.expr(node.init_value) if node.init_value else 'None'
+            return '_Array({}, {})'.format(self.expr(node.size), init_value)
+        if isinstance(node, LambdaDeclareStmt):
+            return self.closure(node, True)
+        if isinstance(node, FuncCallStmt):
+            return self.call(node)
+        raise RuntimeError('Cannot transpile {}'.format(node))
+
+    def call(self, node):
+        groups = call_groups(node)
+        args = [', '.join(self.expr(p) for p in group) for group in groups]
+        name = node.func_name
+        scope = self.scope
+        builtin = node.calls_builtin()
+        if isinstance(name, LambdaDeclareStmt):
+            func = self.expr(name)
+        elif builtin:
+            func = None
+        else:
+            func = self.read_callee(name)
+        if builtin:
+            result = '_call_built_in({!r}, ({}{}))'.format(name, args[0], ',' if args[0] else '')
+        elif (isinstance(name, str) and name == scope.name and not scope.is_lambda and not scope.rebinds_self
+              and name not in scope.declared_global):
+            # Recursive call of the enclosing function
+            if len(groups[0]) != len(scope.param):
+                result = '_invalid_call({!r})'.format(name)
+            else:
+                # Through the memo once the function is memoized
+                result = '({} if _fn.memo is None else _call_memo)(_fn, {}{})'.format(
+                    scope.py_name, self.context(), ', ' + args[0] if args[0] else '')
+        elif scope.toplevel:
+            result = '_call_top({}, {!r}{})'.format(func, str(name), ', ' + args[0] if args[0] else '')
+        else:
+            result = '_call({}, {!r}, {}{})'.format(func, str(name), self.context(),
+                                                  ', ' + args[0] if args[0] else '')
+        for a in args[1:]:
+            result = '_call_chained({}{})'.format(result, ', ' + a if a else '')
+        return result
+
+    def read_callee(self, name):
+        kind = self.storage(name)
+        if kind == 'native':
+            if name in self.scope.unassigned:
+                return '({0} if {0} is not None else _load(_parent, _env, {1!r}))'.format(self.local_name(name), name)
+            return self.local_name(name)
+        if kind == 'global':
+            return '_env.get({!r})'.format(name)
+        if kind == 'frame':
+            return '_v.get({!r})'.format(name) if name not in self.scope.unassigned else \
+                '_lookup(_fr, _env, {!r})'.format(name)
+        if name in self.frame_bound:
+            return '_lookup({}, _env, {!r})'.format(self.context(), name)
+        return '_env.get({!r})'.format(name)
+
+
+def transpile(tree):
+    'Return the Python source of the AST returned by `ty_parse`'
+    return Generator().generate(tree)
+
+
+def compile_tree(tree, filename='<tiny>'):
+    source = transpile(tree)
+    return compile(source, filename, 'exec'), source
+
+
+def execute(tree, env, dump=None):
+    '''
+    Transpile and run the AST returned by `ty_parse` in the global environment `env`.
+    When `dump` is given the generated source is written into it
+    '''
+    code, source = compile_tree(tree)
+    if dump is not None:
+        dump.write(source)
+    return run_code(code, env)
+
+
+def run_code(code, env):
+    '''
+    Run the code object returned by `compile_tree` in the global environment `env`.
+    Global names are read as `_env[name]`, the KeyError of a name that is not declared
+    is reported with the error of the other engines
+    '''
+    namespace = {'_env': env}
+    exec(code, namespace)
+    try:
+        return namespace['_main']()
+    except KeyError as e:
+        name = e.args[0] if len(e.args) == 1 else None
+        if isinstance(name, str) and name not in env:
+            raise Exception('Variable {} not declared'.format(name)) from None
+        raise
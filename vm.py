@@ -0,0 +1,224 @@
+'''
+Stack based virtual machine executing the bytecode produced by `compiler.py`.
+
+Tiny calls do not recurse into Python: every call pushes the state of the caller
+on `calls` and the dispatch loop continues with the callee.
+A call in tail position(TAIL_CALL) reuses the state pushed for the current function instead.
+When the value of the call goes through a statement list(see `ast.TAIL_COMBINED`),
+the pushed state records that a false value is returned as None.
+The state pushed for a call of a memoized function also records where to cache its value.
+'''
+from ast import Array, BreakStmt, check_operands, subscript, store_subscript
+from built_in_functions import call_built_in
+from compiler import *
+from memo import MISSING
+from runtime import Frame, Closure, lookup
+
+
+def run(code, env):
+    'Execute the code object of a program in the global environment `env`'
+    instrs = code.instrs
+    pc = 0
+    stack = []
+    frame = None
+    calls = []
+    push = stack.append
+    pop = stack.pop
+    while True:
+        op, arg = instrs[pc]
+        pc += 1
+        if op == LOAD_NAME:
+            value = lookup(frame, env, arg)
+            if value is None:
+                raise Exception('Variable {} not declared'.format(arg))
+            push(value)
+        elif op == LOAD_CONST:
+            push(arg)
+        elif op == BINOP:
+            rv = pop()
+            lv = stack[-1]
+            t = type(lv)
+            if t is not type(rv) or (t is not int and t is not float):
+                check_operands(lv, rv)
+            stack[-1] = arg(lv, rv)
+        elif op == STORE_NAME:
+            frame.vars[arg] = stack[-1]
+            stack[-1] = None
+        elif op == POP_JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == RELOP:
+            rv = pop()
+            stack[-1] = arg(stack[-1], rv)
+        elif op == LOAD_GLOBAL:
+            if arg not in env:
+                raise Exception('Variable {} not declared'.format(arg))
+            push(env[arg])
+        elif op == STORE_GLOBAL:
+            env[arg] = stack[-1]
+            stack[-1] = None
+        elif op == SUBSCR:
+            if arg == 1:
+                idx = pop()
+                stack[-1] = stack[-1][idx]
+            else:
+                idx = tuple(stack[-arg:])
+                del stack[-arg:]
+                stack[-1] = subscript(stack[-1], idx)
+        elif op == JUMP:
+            pc = arg
+        elif op == COMBINE:
+            rv = pop()
+            if not stack[-1]:
+                stack[-1] = rv if rv else None
+        elif op == LOOP_BODY:
+            value = pop()
+            if value is not None:
+                push(None if isinstance(value, BreakStmt) else value)
+                pc = arg
+        elif op == POP:
+            pop()
+        elif op == CALL:
+            argc, chained = arg
+            if argc:
+                args = stack[-argc:]
+                del stack[-argc:]
+            else:
+                args = []
+            func = pop()
+            if type(func) is Closure:
+                if len(func.param) != argc:
+                    raise Exception('Invalid func call @ {}'.format(func.name))
+                cached = None
+                if func.memo is not None:
+                    key = func.memo.key(args)
+                    value = func.memo.get(key)
+                    if value is not MISSING:
+                        push(value)
+                        continue
+                    cached = (func.memo, key)
+                variables = {func.name: func}
+                variables.update(zip(func.param, args))
+                calls.append((instrs, pc, stack, frame, False, cached))
+                frame = Frame(variables, func.caller if chained else frame)
+                instrs = func.code.instrs
+                pc = 0
+                stack = []
+                push = stack.append
+                pop = stack.pop
+            elif chained:
+                raise Exception('{} is not callable'.format(func))
+            else:
+                push(call_built_in(func, args))
+        elif op == LOAD_CALLEE:
+            if frame is None:
+                func = env.get(arg)
+            else:
+                func = lookup(frame, env, arg)
+                if type(func) is Closure:
+                    func.caller = frame
+            if type(func) is not Closure:
+                raise Exception('callable object {} is not declared'.format(arg))
+            push(func)
+        elif op == RETURN_VALUE:
+            value = pop()
+            if not calls:
+                return value
+            instrs, pc, stack, frame, normalize, cached = calls.pop()
+            push = stack.append
+            pop = stack.pop
+            if normalize and not value:
+                value = None
+            if cached is not None:
+                value = cached[0].put(cached[1], value)
+            push(value)
+        elif op == TAIL_CALL:
+            argc, chained, combined = arg
+            if argc:
+                args = stack[-argc:]
+                del stack[-argc:]
+            else:
+                args = []
+            func = pop()
+            if type(func) is Closure:
+                if len(func.param) != argc:
+                    raise Exception('Invalid func call @ {}'.format(func.name))
+                if func.memo is not None:
+                    key = func.memo.key(args)
+                    value = func.memo.get(key)
+                    if value is not MISSING:
+                        push(value)
+                        continue
+                    # Run as a plain call, whose value is cached when it returns
+                    calls.append((instrs, pc, stack, frame, False, (func.memo, key)))
+                elif not calls or (combined and stack[-1]):
+                    # A previous true value of the statement list is the value of the function
+                    calls.append((instrs, pc, stack, frame, False, None))
+                elif combined and not calls[-1][4]:
+                    calls[-1] = calls[-1][:4] + (True,) + calls[-1][5:]
+                variables = {func.name: func}
+                variables.update(zip(func.param, args))
+                frame = Frame(variables, func.caller if chained else frame)
+                instrs = func.code.instrs
+                pc = 0
+                stack = []
+                push = stack.append
+                pop = stack.pop
+            elif chained:
+                raise Exception('{} is not callable'.format(func))
+            else:
+                push(call_built_in(func, args))
+        elif op == STORE_SUBSCR:
+            obj = pop()
+            idx = tuple(stack[-arg:])
+            del stack[-arg:]
+            store_subscript(obj, idx, stack[-1])
+            stack[-1] = None
+        elif op == JUMP_IF_FALSE_OR_POP:
+            if stack[-1]:
+                pop()
+            else:
+                pc = arg
+        elif op == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == NOT:
+            stack[-1] = not stack[-1]
+        elif op == NEG:
+            stack[-1] = -stack[-1]
+        elif op == XOR:
+            rv = pop()
+            stack[-1] = stack[-1] ^ rv
+        elif op == MAKE_ARRAY:
+            init_value = pop()
+            stack[-1] = Array(stack[-1], init_value)
+        elif op == MAKE_FUNCTION:
+            func = Closure(arg.name, arg.param, arg, caller=frame)
+            if frame is None:
+                env[arg.name] = func
+            else:
+                frame.vars[arg.name] = func
+            push(None)
+        elif op == MAKE_LAMBDA:
+            push(Closure(arg.name, arg.param, arg, caller=frame, is_lambda=True))
+        elif op == DECLARE_GLOBAL:
+            # The compiler already bound the name to the global environment in the whole function body
+            if arg not in env:
+                raise Exception('{} is not declared in global scope'.format(arg))
+            push(None)
+        elif op == LOAD_GLOBAL_CALLEE:
+            func = env.get(arg)
+            if type(func) is not Closure:
+                raise Exception('callable object {} is not declared'.format(arg))
+            if frame is not None:
+                func.caller = frame
+            push(func)
+        else:
+            raise RuntimeError('Unknown opcode {}'.format(op))
+
+
+def execute(tree, env):
+    'Compile and run the AST returned by `ty_parse`'
+    return run(compile_program(tree), env)